@@ -11,6 +11,8 @@ from .day_info import router as day_info_router
 from .ds_info import router as ds_info_router
 from .rnd import router as rnd_router
 from .overview import router as overview_router
+from .tasks import router as tasks_router
+from .whatif import router as whatif_router
 
 router = APIRouter(prefix="/api")
 
@@ -26,3 +28,5 @@ router.include_router(day_info_router)
 router.include_router(ds_info_router)
 router.include_router(rnd_router)
 router.include_router(overview_router)
+router.include_router(tasks_router)
+router.include_router(whatif_router)
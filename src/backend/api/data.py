@@ -1,5 +1,10 @@
-from pydantic import BaseModel, field_validator
-from fastapi import APIRouter
+import asyncio
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import numpy as np
 import pandas as pd
 import nilmtk
 
@@ -13,8 +18,12 @@ import enilm.datasets.loaders
 import enilm.appliances
 
 from .. import tz
-from ..data import get_data
+from ..downsample import DownsampleMode, Pyramid, get_pyramid
+from ..pred import full_pred
+from ..pred_store import FullPred
+from ..series_store import StoredIndex, downsampled_series, get_series_store
 from ..types import RawDataDict, PDTimestamp
+from ..types.series import NPArray_F32, regular_freq
 from ..mem import ds_house_dt_range_memory
 from ..apps import find_matching_app_name_in_data_keys
 
@@ -75,6 +84,9 @@ class DataStartDurationParams(BaseModel):
     app_name: enilm.etypes.AppName
     start: PDTimestamp
     duration: str
+    # at most this many points (min/max of buckets by default), all samples if None
+    max_points: int | None = Field(None, ge=4)
+    downsample: DownsampleMode = DownsampleMode.MINMAX
 
     @field_validator("duration")
     @classmethod
@@ -94,12 +106,13 @@ async def getDataStartDuration(params: DataStartDurationParams) -> RawDataDict:
     assert isinstance(params.duration, str)
     assert isinstance(params.app_name, str)
 
-    # get all data
-    data = get_data(params.data_exp_name).overlapping_data
+    # stored data, see backend.series_store
+    store = await run_in_threadpool(get_series_store, params.data_exp_name)
     matched_app_name = find_matching_app_name_in_data_keys(
         params.data_exp_name,
         params.app_name,
-        data.keys(),
+        store.columns.keys(),
+        store.app_names,
     )
 
     # change timezone of start time from UTC to the timezone of the data without changing the time
@@ -107,21 +120,22 @@ async def getDataStartDuration(params: DataStartDurationParams) -> RawDataDict:
         params.start,
         params.data_exp_name,
     )
+    assert store.index.first() <= start_time_with_tz <= store.index.last()
 
-    start = data[matched_app_name].index[0]
-    assert isinstance(start, pd.Timestamp)
-    assert start_time_with_tz >= start
-
-    end = data[matched_app_name].index[-1]
-    assert isinstance(end, pd.Timestamp)
-    assert start_time_with_tz <= end
-
-    # slice data
-    overlapping_data_slice: enilm.etypes.ser.PDTimeSeries = data[matched_app_name][
-        start_time_with_tz : start_time_with_tz + pd.Timedelta(params.duration)
-    ]
-
-    overlapping_data_dict: RawDataDict = overlapping_data_slice.to_dict()
+    # slice data (two positions, no copy of the values)
+    i, j = store.range_slice(
+        start_time_with_tz, start_time_with_tz + pd.Timedelta(params.duration)
+    )
+    # built and stored on first use
+    pyramid = await run_in_threadpool(store.pyramid, matched_app_name)
+    overlapping_data_dict: RawDataDict = downsampled_series(
+        pyramid,
+        store.index,
+        i,
+        j,
+        params.max_points,
+        params.downsample,
+    ).to_dict()
     return overlapping_data_dict
 
 
@@ -130,6 +144,9 @@ class DataStartEndParams(BaseModel):
     app_name: enilm.etypes.AppName
     start: PDTimestamp
     end: PDTimestamp
+    # at most this many points (min/max of buckets by default), all samples if None
+    max_points: int | None = Field(None, ge=4)
+    downsample: DownsampleMode = DownsampleMode.MINMAX
 
 
 @router.post("/start_end")
@@ -138,16 +155,16 @@ async def getDataStartEnd(params: DataStartEndParams) -> RawDataDict:
     assert isinstance(params.end, pd.Timestamp)
     assert isinstance(params.app_name, str)
 
-    # get all data
-    data = get_data(params.exp_name).overlapping_data
-    
+    # stored data, see backend.series_store
+    store = await run_in_threadpool(get_series_store, params.exp_name)
+
     # get correct app name
     matched_app_name = find_matching_app_name_in_data_keys(
         params.exp_name,
         params.app_name,
-        data.keys(),
+        store.columns.keys(),
+        store.app_names,
     )
-    params.app_name = matched_app_name
 
     # change timezone from UTC to the timezone of the data without changing the time
     start_time_with_tz: pd.Timestamp = tz.convert_pdtimestamp_for_exp_data(
@@ -158,22 +175,243 @@ async def getDataStartEnd(params: DataStartEndParams) -> RawDataDict:
         params.end,
         params.exp_name,
     )
+    assert store.index.first() <= start_time_with_tz <= store.index.last()
+
+    # slice data (two positions, no copy of the values)
+    i, j = store.range_slice(start_time_with_tz, end_time_with_tz)
+    # built and stored on first use
+    pyramid = await run_in_threadpool(store.pyramid, matched_app_name)
+    overlapping_data_dict: RawDataDict = downsampled_series(
+        pyramid,
+        store.index,
+        i,
+        j,
+        params.max_points,
+        params.downsample,
+    ).to_dict()
+    return overlapping_data_dict
+
 
-    start = data[params.app_name].index[0]
-    assert isinstance(start, pd.Timestamp)
-    assert start_time_with_tz >= start
+class PredStartEndParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    app_name: enilm.etypes.AppName
+    model_exp_name: str | None = None  # defaults to data_exp_name
+    start: PDTimestamp
+    end: PDTimestamp
+    max_points: int | None = Field(None, ge=4)
+    downsample: DownsampleMode = DownsampleMode.MINMAX
 
-    end = data[params.app_name].index[-1]
-    assert isinstance(end, pd.Timestamp)
-    assert start_time_with_tz <= end
 
-    # slice data
-    overlapping_data_slice: enilm.etypes.ser.PDTimeSeries = data[params.app_name][
-        start_time_with_tz:end_time_with_tz
-    ]
+@router.post("/pred_start_end")
+async def getPredStartEnd(params: PredStartEndParams) -> RawDataDict:
+    """Full predictions (see backend.pred.full_pred) of the app within the time range"""
+    assert isinstance(params.start, pd.Timestamp)
+    assert isinstance(params.end, pd.Timestamp)
 
-    overlapping_data_dict: RawDataDict = overlapping_data_slice.to_dict()
-    return overlapping_data_dict
+    store = await run_in_threadpool(get_series_store, params.data_exp_name)
+    matched_app_name = find_matching_app_name_in_data_keys(
+        params.data_exp_name,
+        params.app_name,
+        store.columns.keys(),
+        store.app_names,
+    )
+
+    # blocking (prediction tasks if not stored yet) -> not in the event loop
+    pred = await run_in_threadpool(
+        full_pred,
+        data_exp_name=params.data_exp_name,
+        app_name=matched_app_name,
+        model_exp_name=params.model_exp_name,
+    )
+    index = StoredIndex.load(pred.meta.index, pred.path)
+    pyramid = await run_in_threadpool(get_pyramid, pred.path / "pyramid", pred.values)
+
+    start_time_with_tz = tz.convert_pdtimestamp_for_exp_data(
+        params.start, params.data_exp_name
+    )
+    end_time_with_tz = tz.convert_pdtimestamp_for_exp_data(
+        params.end, params.data_exp_name
+    )
+    i, j = index.range_slice(start_time_with_tz, end_time_with_tz)
+    pred_dict: RawDataDict = downsampled_series(
+        pyramid, index, i, j, params.max_points, params.downsample
+    ).to_dict()
+    return pred_dict
+
+
+class RangeSeriesParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    app_name: enilm.etypes.AppName | None = None  # None for the mains
+    pred: bool = False  # predictions for the app instead of its data
+    model_exp_name: str | None = None  # of the predictions, defaults to exp_name
+
+    @model_validator(mode="after")
+    def check_pred(self):
+        if self.pred and self.app_name is None:
+            raise ValueError("No predictions of the mains")
+        return self
+
+
+class RangeParams(BaseModel):
+    exp_name: str
+    series: List[RangeSeriesParams]
+    start: PDTimestamp
+    end: PDTimestamp
+    # at most this many index entries (buckets of samples), all samples if None
+    max_points: int | None = Field(None, ge=4)
+    downsample: DownsampleMode = DownsampleMode.MINMAX
+
+    @model_validator(mode="after")
+    def check_downsample(self):
+        if self.max_points is not None and self.downsample is DownsampleMode.LTTB:
+            raise ValueError("lttb does not align the series, use minmax or mean")
+        return self
+
+
+class RangeIndex(BaseModel):
+    """Shared index, regular (`start + i * freq`) or the timestamps in ms since epoch (utc)"""
+
+    n: int
+    start: PDTimestamp | None = None
+    freq: str | None = None
+    tz: str | None = None
+    timestamps: List[int] | None = None  # irregular only
+
+    @classmethod
+    def of(cls, index: pd.DatetimeIndex) -> "RangeIndex":
+        tz = str(index.tz) if index.tz is not None else None
+        freq = regular_freq(index)
+        if freq is not None:
+            return cls(n=len(index), start=index[0], freq=freq, tz=tz)
+        if len(index) == 1:
+            return cls(n=1, start=index[0], tz=tz)
+        return cls(
+            n=len(index),
+            tz=tz,
+            timestamps=(index.as_unit("ms").asi8).tolist(),
+        )
+
+
+class RangeColumn(BaseModel):
+    values: NPArray_F32  # the samples, or the mean of each bucket if downsampled
+    # of each bucket, minmax mode only
+    min: NPArray_F32 | None = None
+    max: NPArray_F32 | None = None
+
+
+class RangeResponse(BaseModel):
+    index: RangeIndex
+    downsampled: bool
+    columns: List[RangeColumn]  # in the order of the requested series
+
+
+@router.post("/range")
+async def getRange(params: RangeParams) -> RangeResponse:
+    """
+    Data and predictions of several series of an exp within a time range, on one index
+
+    The series are columns of the stored data (see backend.series_store) and full predictions
+    (see backend.pred.full_pred), both on the index of the mains, so all of them are sliced at
+    the same positions. If downsampled, each column is reduced to the same buckets of samples
+    (the stored pyramids, see backend.downsample), lttb picks other points for each series and
+    is not supported here.
+    """
+    assert isinstance(params.start, pd.Timestamp)
+    assert isinstance(params.end, pd.Timestamp)
+
+    store = await run_in_threadpool(get_series_store, params.exp_name)
+
+    # once for all series
+    start_time_with_tz = tz.convert_pdtimestamp_for_exp_data(
+        params.start, params.exp_name
+    )
+    end_time_with_tz = tz.convert_pdtimestamp_for_exp_data(params.end, params.exp_name)
+    i, j = store.range_slice(start_time_with_tz, end_time_with_tz)
+    downsampled = params.max_points is not None and j - i > params.max_points
+
+    names: List[str] = []
+    for series in params.series:
+        if series.app_name is None:
+            names.append("mains")
+        else:
+            names.append(
+                find_matching_app_name_in_data_keys(
+                    params.exp_name,
+                    series.app_name,
+                    store.columns.keys(),
+                    store.app_names,
+                )
+            )
+
+    # blocking (prediction tasks if not stored yet) -> not in the event loop, in parallel
+    pred_series = [(k, series) for k, series in enumerate(params.series) if series.pred]
+    preds: List[FullPred] = await asyncio.gather(
+        *[
+            run_in_threadpool(
+                full_pred,
+                data_exp_name=params.exp_name,
+                app_name=names[k],
+                model_exp_name=series.model_exp_name,
+            )
+            for k, series in pred_series
+        ]
+    )
+    pred_by_series = {k: pred for (k, _), pred in zip(pred_series, preds)}
+    for k, pred in pred_by_series.items():
+        if pred.meta.index.n != store.meta.index.n:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Predictions of {names[k]} are not on the index of the data of {params.exp_name}",
+            )
+
+    if not downsampled:
+        columns = [
+            RangeColumn(
+                values=np.asarray(
+                    (
+                        pred_by_series[k].values
+                        if k in pred_by_series
+                        else store.columns[names[k]]
+                    )[i:j]
+                )
+            )
+            for k in range(len(params.series))
+        ]
+        return RangeResponse(
+            index=RangeIndex.of(store.index.slice(i, j)),
+            downsampled=False,
+            columns=columns,
+        )
+
+    def _pyramid(k: int) -> Pyramid:
+        # built and stored on first use
+        if k in pred_by_series:
+            pred = pred_by_series[k]
+            return get_pyramid(pred.path / "pyramid", pred.values)
+        return store.pyramid(names[k])
+
+    assert params.max_points is not None
+    pyramids: List[Pyramid] = await asyncio.gather(
+        *[run_in_threadpool(_pyramid, k) for k in range(len(params.series))]
+    )
+    # same positions for all series -> same buckets
+    buckets = [p.buckets_within(i, j, params.max_points) for p in pyramids]
+    minmax = params.downsample is DownsampleMode.MINMAX
+    return RangeResponse(
+        index=RangeIndex.of(
+            store.index.take(buckets[0].start) if buckets else store.index.slice(i, i)
+        ),
+        downsampled=True,
+        columns=[
+            RangeColumn(
+                values=b.mean,
+                min=b.min if minmax else None,
+                max=b.max if minmax else None,
+            )
+            for b in buckets
+        ],
+    )
 
 
 @router.get("/datasets")
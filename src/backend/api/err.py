@@ -1,33 +1,65 @@
-from typing import List, Optional, Dict
+import os
+import asyncio
+import datetime
+from typing import List, Optional, Dict, Tuple
 
 import joblib
-from pydantic import BaseModel, ConfigDict
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict, Field
 from fastapi import APIRouter
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
-from loguru import logger
+import pandas as pd
 from celery.result import AsyncResult
 
 import enilm.etypes
 
 from .. import exps
-from .. import metrics
 from .. import apps
+from .. import tz
 from ..pred import full_pred
-from ..mem import get_exp_mem, cache_folder
-from ..data import get_data
-from ..tasks.err import compute_errors as compute_errors_task
+from ..pred_store import FullPred
+from ..progress import await_task_result
+from ..mem import get_exp_mem
+from ..data import get_overlapping_data
+from ..err_index import get_err_index, SortedErrors
+from ..err_cube import DayType, get_err_cube, get_day_types
+from ..model import get_weights_hash
+from ..utils import LRUCache
+from ..tasks.err import (
+    compute_errors as compute_errors_task,
+    compare_models as compare_models_task,
+)
 
 from .. import types
-from ..types.err import ErrType
-from ..types.tasks.err import ComputeErrTaskParams, ComputeErrTaskResult
-
+from ..types.err import ErrType, SplitErrors, err_units
+from ..types.pred import PredictionError
+from ..types.series import NPArray_F32
+from ..types.tasks.err import (
+    ComputeErrTaskParams,
+    ComputeErrTaskResult,
+    CompareModel,
+    CompareTaskParams,
+    CompareTaskResult,
+)
+
+load_dotenv()
 
 router = APIRouter(prefix="/err")
 
+# max. number of sorted window errors kept in memory by this process (LRU eviction)
+sorted_errors_cache_size = int(os.environ.get("SORTED_ERRORS_CACHE_SIZE", 16))
+
 
 higher_better: Dict[ErrType, bool] = {
     ErrType.MAE: False,
     ErrType.F1: True,
+    ErrType.RMSE: False,
+    ErrType.SAE: False,
+    ErrType.NDE: False,
+    ErrType.EA: True,
+    ErrType.PRECISION: True,
+    ErrType.RECALL: True,
 }
 
 
@@ -41,7 +73,7 @@ async def getHigherBetter() -> Dict[str, bool]:
     return {err_type.value: higher_better[err_type] for err_type in ErrType}
 
 
-def compute_errors(
+async def compute_errors(
     exp_name: str,
     app_name: enilm.etypes.AppName,
     err_type: ErrType = ErrType.MAE,
@@ -51,37 +83,55 @@ def compute_errors(
     memory: joblib.Memory = get_exp_mem(exp_name).memory
     exp: exps.ModelExp = exps.get_model_exp_by_name(exp_name)
 
-    data = get_data(exp_name).overlapping_data
-    matched_app_name = apps.find_matching_app_name_in_data_keys(
-        exp_name,
-        app_name,
-        data.keys(),
-    )
-    pred_all = full_pred(
-        data_exp_name=exp_name,
-        app_name=matched_app_name,
-    )
+    def _full_pred() -> Tuple[FullPred, str]:
+        data = get_overlapping_data(exp_name)
+        matched_app_name = apps.find_matching_app_name_in_data_keys(
+            exp_name,
+            app_name,
+            data.keys(),
+        )
+        pred = full_pred(
+            data_exp_name=exp_name,
+            app_name=matched_app_name,
+        )
+        return pred, matched_app_name
+
+    # blocking (loading data, prediction tasks) -> not in the event loop
+    pred_all, matched_app_name = await run_in_threadpool(_full_pred)
 
     # to json for the task
     params_json: str = ComputeErrTaskParams(
         exp_name=exp_name,
-        app_name=app_name,
+        app_name=matched_app_name,
         err_type=err_type,
         seq_len=exp.sequence_length,
         on_power_threshold=exp.on_power_threshold,
-        full_pred=pred_all,
+        full_pred_path=pred_all.path,
     ).model_dump_json()
 
-    def _compute_errors(params_json: str) -> ComputeErrTaskResult:
-        task = compute_errors_task.delay(params_json)
-        res_json = task.get()
+    # the result is passed in after awaiting the task, it is not part of the cache key
+    def _compute_errors(
+        params_json: str, res_json: str | None = None
+    ) -> ComputeErrTaskResult:
+        if res_json is None:
+            res_json = compute_errors_task.delay(params_json).get()
         return ComputeErrTaskResult.model_validate_json(res_json)
 
+    async def _await_compute_errors(params_json: str) -> str:
+        task = compute_errors_task.delay(params_json)
+        return await await_task_result(task)
+
     if sync:
         if no_cache:
-            return _compute_errors(params_json)
+            return _compute_errors(
+                params_json, await _await_compute_errors(params_json)
+            )
         if not no_cache:
-            res = memory.cache(_compute_errors)(params_json)
+            cached = memory.cache(_compute_errors, ignore=["res_json"])
+            if cached.check_call_in_cache(params_json):
+                res = cached(params_json)
+            else:
+                res = cached(params_json, await _await_compute_errors(params_json))
             assert isinstance(res, ComputeErrTaskResult)
             return res
 
@@ -103,11 +153,14 @@ class ErrHistResponse(BaseModel):
     hist: List[int]
     bin_edges: List[float]
     unit: str
+    # F1 only: histograms of the windows' precision and recall with the same bin edges
+    precision_hist: List[int] | None = None
+    recall_hist: List[int] | None = None
 
 
 @router.post("/hist")
 async def getErrHist(params: ErrHistParams) -> ErrHistResponse:
-    errors_res = compute_errors(
+    errors_res = await compute_errors(
         exp_name=params.data_exp_name,
         app_name=params.app_name,
         err_type=params.err_type,
@@ -116,7 +169,17 @@ async def getErrHist(params: ErrHistParams) -> ErrHistResponse:
     errors = errors_res.errors
     hist, bin_edges = np.histogram(errors, bins=params.bins)
 
-    return ErrHistResponse(hist=hist.tolist(), bin_edges=bin_edges.tolist(), unit="W")
+    res = ErrHistResponse(
+        hist=hist.tolist(),
+        bin_edges=bin_edges.tolist(),
+        unit=err_units[params.err_type],
+    )
+    if errors_res.precision is not None and errors_res.recall is not None:
+        res.precision_hist = np.histogram(errors_res.precision, bins=bin_edges)[
+            0
+        ].tolist()
+        res.recall_hist = np.histogram(errors_res.recall, bins=bin_edges)[0].tolist()
+    return res
 
 
 class RndDateWithErrParams(BaseModel):
@@ -126,14 +189,45 @@ class RndDateWithErrParams(BaseModel):
     err_min: float
     err_max: float
     duration_samples: int
+    k: int = Field(1, ge=1)  # number of windows to sample
+
+
+class RndDateWindow(BaseModel):
+    start_date: types.PDTimestamp
+    end_date: types.PDTimestamp
+    err: float
 
 
 class RndDateWithErrResponse(BaseModel):
     err: bool = False
     err_msg: str = ""
+    # first sampled window
     start_date: Optional[types.PDTimestamp] = None
     end_date: Optional[types.PDTimestamp] = None
     duration_samples: Optional[int] = None
+    windows: List[RndDateWindow] = []  # all sampled windows (up to k)
+
+
+# sorted window errors of this process by (exp, app, err type, weights hash)
+_sorted_errors: LRUCache[SortedErrors] = LRUCache(sorted_errors_cache_size)
+
+
+async def get_sorted_errors(
+    exp_name: str, app_name: enilm.etypes.AppName, err_type: ErrType
+) -> Tuple[SortedErrors, int]:
+    """Sorted errors and the number of windows"""
+    key = (exp_name, app_name, err_type, get_weights_hash(exp_name))
+    sorted_errors = _sorted_errors.get(key)
+    if sorted_errors is None:
+        errors_res = await compute_errors(
+            exp_name=exp_name,
+            app_name=app_name,
+            err_type=err_type,
+        )
+        assert isinstance(errors_res, ComputeErrTaskResult)
+        sorted_errors = SortedErrors.of(errors_res.errors)
+        _sorted_errors.put(key, sorted_errors)
+    return sorted_errors, len(sorted_errors.order)
 
 
 @router.post("/rnd_date_with_err")
@@ -142,25 +236,15 @@ async def getRndDateWithErr(params: RndDateWithErrParams) -> RndDateWithErrRespo
     if not isinstance(exps.get_exp_by_name(params.exp_name), exps.ModelExp):
         raise ValueError("The selected exp does not have a model!")
 
-    errors_res = compute_errors(
-        exp_name=params.exp_name,
-        app_name=params.app_name,
-        err_type=params.err_type,
+    sorted_errors, n_windows = await get_sorted_errors(
+        params.exp_name, params.app_name, params.err_type
     )
-    assert isinstance(errors_res, ComputeErrTaskResult)
-    errors = errors_res.errors
-
-    # match each error to the window idx
-    err_wind_idx = [(idx, errors[idx]) for idx in range(len(errors))]
 
-    # shuffle the error window idx
-    np.random.shuffle(err_wind_idx)
-
-    # find the first error window idx that is within the range
-    for wind_idx, err in err_wind_idx:
-        if params.err_min <= err <= params.err_max:
-            break
-    if wind_idx == len(errors) - 1:
+    # random windows with an error within the range: binary search + random pick
+    wind_idxs, wind_errors = sorted_errors.sample(
+        params.err_min, params.err_max, params.k
+    )
+    if len(wind_idxs) == 0:
         return RndDateWithErrResponse(err=True, err_msg="No error window found")
 
     # return the corresponding window of data
@@ -171,7 +255,7 @@ async def getRndDateWithErr(params: RndDateWithErrParams) -> RndDateWithErrRespo
         else params.duration_samples
     )
 
-    data = get_data(params.exp_name).overlapping_data
+    data = get_overlapping_data(params.exp_name)
     matched_app_name = apps.find_matching_app_name_in_data_keys(
         params.exp_name,
         params.app_name,
@@ -179,15 +263,25 @@ async def getRndDateWithErr(params: RndDateWithErrParams) -> RndDateWithErrRespo
     )
     app_data = data[matched_app_name]
 
-    if not ((app_data.size - exp.sequence_length) == len(errors)):
+    if not ((app_data.size - exp.sequence_length) == n_windows):
         raise ValueError(
             "Number of computed errors does not match the number of windows! Something is gone wrong!!!"
         )
 
+    windows = [
+        RndDateWindow(
+            start_date=app_data.index[wind_idx],  # type: ignore
+            # the window may extend beyond the data for long durations
+            end_date=app_data.index[min(wind_idx + wind_size, app_data.size - 1)],  # type: ignore
+            err=float(wind_err),
+        )
+        for wind_idx, wind_err in zip(wind_idxs, wind_errors)
+    ]
     return RndDateWithErrResponse(
-        start_date=app_data.index[wind_idx],  # type: ignore
-        end_date=app_data.index[wind_idx + wind_size],  # type: ignore
+        start_date=windows[0].start_date,
+        end_date=windows[0].end_date,
         duration_samples=wind_size,  # note: this may be different from params.duration_samples
+        windows=windows,
     )
 
 
@@ -206,54 +300,219 @@ class TotalErrResponse(BaseModel):
     err_unit: str
 
 
+def get_split_errors(
+    data_exp_name: str,
+    app_name: enilm.etypes.AppName,
+    model_exp_name: str,
+) -> SplitErrors:
+    """
+    All errors of the train, test and whole series, from the error index of the full prediction
+
+    Blocking (may compute the full prediction), use `run_in_threadpool` in async handlers.
+    """
+    # F1, precision and recall with the threshold of the data exp
+    data_exp: exps.Exp = exps.get_exp_by_name(data_exp_name)
+    err_index = get_err_index(
+        data_exp_name, app_name, model_exp_name, data_exp.on_power_threshold
+    )
+    model_exp: exps.ModelExp = exps.get_model_exp_by_name(model_exp_name)
+    train_size = int(model_exp.selected_train_percent * len(err_index))
+    return err_index.split_errors(train_size)
+
+
 @router.post("/total_err")
 async def getTotalErr(params: TotalErrParams) -> TotalErrResponse:
-    memory: joblib.Memory = joblib.Memory(cache_folder / "total_err", verbose=1)
+    split = await run_in_threadpool(
+        get_split_errors,
+        params.data_exp_name,
+        params.app_name,
+        params.model_exp_name,
+    )
+    return TotalErrResponse(
+        train_err=split.train[params.err_type],
+        test_err=split.test[params.err_type],
+        total_err=split.total[params.err_type],
+        err_unit=err_units[params.err_type],
+    )
+
+
+class SplitErrParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    app_name: enilm.etypes.AppName
+    model_exp_name: str
+
+
+@router.post("/split_errors")
+async def getSplitErrors(params: SplitErrParams) -> SplitErrors:
+    """All error types at once, see `getTotalErr`"""
+    return await run_in_threadpool(
+        get_split_errors,
+        params.data_exp_name,
+        params.app_name,
+        params.model_exp_name,
+    )
+
+
+class RangeErrParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    app_name: enilm.etypes.AppName
+    model_exp_name: str | None = None  # defaults to data_exp_name
+    start: types.PDTimestamp
+    end: types.PDTimestamp  # inclusive
+    # samples, errors of each window starting in the range
+    window: int | None = Field(None, ge=1)
+
+
+class RangeErrResponse(BaseModel):
+    n_samples: int
+    errors: List[PredictionError]  # over the range
+    window_start: types.PDTimestamp | None = None  # start of the first window
+    window_errors: Dict[ErrType, NPArray_F32] | None = None  # one per window
+
+
+@router.post("/range")
+async def getRangeErr(params: RangeErrParams) -> RangeErrResponse:
+    """Errors of any range (and its windows) from prefix sums, see backend.err_index"""
+    err_index = await run_in_threadpool(
+        get_err_index,
+        params.data_exp_name,
+        params.app_name,
+        params.model_exp_name,
+    )
+    start, stop = err_index.range_slice(
+        tz.convert_pdtimestamp_for_exp_data(params.start, params.data_exp_name),
+        tz.convert_pdtimestamp_for_exp_data(params.end, params.data_exp_name),
+    )
+    sums = err_index.sums(start, stop)
+    res = RangeErrResponse(
+        n_samples=sums.n,
+        errors=[
+            PredictionError(name=err_type.value, value=value, unit=err_units[err_type])
+            for err_type, value in sums.metrics(ErrType).items()
+        ],
+    )
+    if params.window is not None:
+        res.window_errors = err_index.window_errors(start, stop, params.window)
+        if stop - start >= params.window:
+            res.window_start = err_index.index[start]
+    return res
+
+
+class CompareParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    app_name: enilm.etypes.AppName
+    model_exp_names: List[str] = Field(min_length=1)
+    err_types: List[ErrType] = Field(list(ErrType), min_length=1)
+    # samples, errors of each window starting at each sample
+    window: int | None = Field(None, ge=1)
+
 
-    @memory.cache
-    def cached(params: TotalErrParams) -> TotalErrResponse:
-        logger.info("Computing total error")
-        data = get_data(params.data_exp_name).overlapping_data
+@router.post("/compare")
+async def compareModels(params: CompareParams) -> CompareTaskResult:
+    """
+    Errors of several model exps on the same data exp (metrics table and aligned window errors)
+
+    The data is loaded once, the missing full predictions are computed in parallel and
+    the errors of all models are computed by a single compare_models task.
+    """
+
+    def _load_data():
+        data = get_overlapping_data(params.data_exp_name)
         matched_app_name = apps.find_matching_app_name_in_data_keys(
             params.data_exp_name,
             params.app_name,
             data.keys(),
         )
-        data_exp: exps.Exp = exps.get_exp_by_name(params.data_exp_name)
-        gt_np = np.array(list(data[matched_app_name]), dtype=np.float32)
+        return data, matched_app_name
+
+    # blocking (loading data, prediction tasks) -> not in the event loop
+    data, matched_app_name = await run_in_threadpool(_load_data)
+    preds: List[FullPred] = await asyncio.gather(
+        *[
+            run_in_threadpool(
+                full_pred,
+                data_exp_name=params.data_exp_name,
+                app_name=matched_app_name,
+                model_exp_name=model_exp_name,
+                data=data,
+            )
+            for model_exp_name in params.model_exp_names
+        ]
+    )
 
-        pred_all = full_pred(
+    models = []
+    for model_exp_name, pred in zip(params.model_exp_names, preds):
+        model_exp: exps.ModelExp = exps.get_model_exp_by_name(model_exp_name)
+        models.append(
+            CompareModel(
+                model_exp_name=model_exp_name,
+                full_pred_path=pred.path,
+                on_power_threshold=model_exp.on_power_threshold,
+                selected_train_percent=model_exp.selected_train_percent,
+            )
+        )
+    task = compare_models_task.delay(
+        CompareTaskParams(
             data_exp_name=params.data_exp_name,
             app_name=matched_app_name,
-            model_exp_name=params.model_exp_name,
-        )
-        pr_np = np.array(list(pred_all.pred.values()), dtype=np.float32)
-
-        model_exp: exps.ModelExp = exps.get_model_exp_by_name(params.model_exp_name)
-        selected_train_percent: float = model_exp.selected_train_percent
-        train_size = int(selected_train_percent * gt_np.size)
-
-        if params.err_type is ErrType.MAE:
-            logger.info("Computing MAE")
-            return TotalErrResponse(
-                train_err=metrics.mae(gt_np[:train_size], pr_np[:train_size]),
-                test_err=metrics.mae(gt_np[train_size:], pr_np[train_size:]),
-                total_err=metrics.mae(gt_np, pr_np),
-                err_unit="W",
-            )
-        elif params.err_type is ErrType.F1:
-            logger.info("Computing F1")
-            return TotalErrResponse(
-                train_err=metrics.f1_score(
-                    gt_np[:train_size], pr_np[:train_size], data_exp.on_power_threshold
-                ),
-                test_err=metrics.f1_score(
-                    gt_np[train_size:], pr_np[train_size:], data_exp.on_power_threshold
-                ),
-                total_err=metrics.f1_score(gt_np, pr_np, data_exp.on_power_threshold),
-                err_unit="",
-            )
+            models=models,
+            err_types=params.err_types,
+            window=params.window,
+        ).model_dump_json()
+    )
+    return CompareTaskResult.model_validate_json(await await_task_result(task))
+
+
+class ErrCubeParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    app_name: enilm.etypes.AppName
+    model_exp_name: str | None = None  # defaults to data_exp_name
+    err_type: ErrType
 
-        raise ValueError(f"Unknown error type: {params.err_type}")
 
-    return cached(params)
+class ErrCubeResponse(BaseModel):
+    days: List[datetime.date]
+    day_types: List[DayType]  # of each day
+    # day x hour of day (local time), None for hours without samples
+    errors: List[List[float | None]]
+    n_samples: List[List[int]]
+    # hour-of-day profile of all days of each type
+    day_type_errors: Dict[DayType, List[float | None]]
+    unit: str
+
+
+@router.post("/cube")
+async def getErrCube(params: ErrCubeParams) -> ErrCubeResponse:
+    """Errors by day and hour of day for a heatmap, see backend.err_cube"""
+
+    def _load():
+        cube = get_err_cube(
+            params.data_exp_name, params.app_name, params.model_exp_name
+        )
+        return cube, get_day_types(params.data_exp_name, cube.days)
+
+    # blocking (may compute the full prediction) -> not in the event loop
+    cube, day_types = await run_in_threadpool(_load)
+
+    def to_list(values: np.ndarray, n: np.ndarray) -> list:
+        values = np.where(n > 0, np.asarray(values, dtype=float), np.nan)
+        return [
+            [None if np.isnan(v) else float(v) for v in row]
+            for row in np.atleast_2d(values)
+        ]
+
+    return ErrCubeResponse(
+        days=pd.DatetimeIndex(cube.days).date.tolist(),
+        day_types=day_types,
+        errors=to_list(cube.sums.metric(params.err_type), cube.sums.n),
+        n_samples=np.asarray(cube.sums.n, dtype=int).tolist(),
+        day_type_errors={
+            day_type: to_list(sums.metric(params.err_type), sums.n)[0]
+            for day_type, sums in cube.by_day_type(day_types).items()
+        },
+        unit=err_units[params.err_type],
+    )
@@ -5,6 +5,8 @@ from fastapi import APIRouter
 from .. import exps
 from .. import types
 from .. import dates
+from ..export import ExportReport, get_export_reports
+from ..quant import QuantReport, get_quant_reports
 
 router = APIRouter(prefix="/exps")
 
@@ -48,3 +50,15 @@ async def getAllExps() -> List[ParsedExp | ParsedModelExp]:
         else:
             raise ValueError(f"Unknown exp type: {exp}")
     return all_exps
+
+
+@router.get("/export_reports")
+async def getExportReports() -> List[ExportReport]:
+    """Accuracy and speedup of exported models (see INFERENCE_BACKEND)"""
+    return get_export_reports()
+
+
+@router.get("/quant_reports")
+async def getQuantReports() -> List[QuantReport]:
+    """Accuracy (test split) and speedup of int8 quantized models compared to fp32"""
+    return get_quant_reports()
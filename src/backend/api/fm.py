@@ -63,7 +63,6 @@ async def get_feature_map(params: GetFeatureMapParams) -> GetFeatureMapResponse:
     exp: exps.ModelExp = exps.get_model_exp_by_name(params.model_exp)
     device: torch.device = get_device()
     model: nn.Module = get_model_for_exp(params.model_exp, device)
-    model.eval()
 
     # prepare the input data: upsample or downsample to the expected sequence length
     input_data: np.ndarray = np.array(list(params.input_data.values()))
@@ -93,17 +92,25 @@ async def get_feature_map(params: GetFeatureMapParams) -> GetFeatureMapResponse:
         return hook
 
     # register hooks on the convolution layers
+    # note: the model is shared through the model cache, hooks are removed after the forward pass
+    hooks = []
     conv_layer_count = 0
     for layer in model.children():
         if isinstance(layer, nn.Conv1d) or isinstance(layer, nn.Conv2d):
             conv_layer_count += 1
-            layer.register_forward_hook(get_activation(f"conv{conv_layer_count}"))
+            hooks.append(
+                layer.register_forward_hook(get_activation(f"conv{conv_layer_count}"))
+            )
         if isinstance(layer, nn.Conv2d):
             # TODO
             logger.warning("Model with 2D Conver layers is not tested yet!")
 
     # perform a forward pass with the input tensor
-    preds = model(input_tensor).detach()
+    try:
+        preds = model(input_tensor).detach()
+    finally:
+        for hook in hooks:
+            hook.remove()
 
     # convert to numpy arrays
     preds = preds.cpu().numpy().flatten()
@@ -4,7 +4,7 @@ from pydantic import BaseModel
 
 import enilm.yaml.data
 
-from ..data import get_data
+from ..data import get_overlapping_data
 from ..config import get_config
 from ..types import RawDataDict
 from ..mem import overview_daily_mean_memory
@@ -14,7 +14,7 @@ router = APIRouter(prefix="/overview")
 
 @router.post("/valid_years")
 async def get_valid_years(exp_name: str) -> list[int]:
-    data: enilm.yaml.data.RawData = get_data(exp_name).overlapping_data
+    data: enilm.yaml.data.RawData = get_overlapping_data(exp_name)
 
     # get all years
     ts_index = data["mains"].index
@@ -34,7 +34,7 @@ async def get_daily_mean(exp_name: str) -> DailyMeanResponse:
     @overview_daily_mean_memory.cache
     def _cached(exp_name):
         # get data
-        data: enilm.yaml.data.RawData = get_data(exp_name).overlapping_data
+        data: enilm.yaml.data.RawData = get_overlapping_data(exp_name)
 
         # get exp app
         apps = get_config(exp_name).selected_apps
@@ -1,9 +1,16 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from celery.result import AsyncResult
 import pydantic
 from pydantic import BaseModel
 
 from ..pred import pred
+from ..batching import predict_mode, supports_server_pred, server_pred
+from ..payload import parse_body, encode_response, ARROW_MEDIA_TYPE
+from ..pred_cache import pred_cache, PredCacheStats
+from ..pred_stream import ndjson_stream, arrow_stream
+from ..tasks.pred import pred_stream as pred_stream_task
 from ..types.pred import PredictParams, PredictResponse
 from ..types.tasks import CeleryTaskId, TaskState
 from ..types.tasks.pred import PredProgressResponse, PredProgressMsg
@@ -11,13 +18,48 @@ from ..types.tasks.pred import PredProgressResponse, PredProgressMsg
 
 router = APIRouter(prefix="/predict")
 
+# request body (PredictParams) and response can be json, msgpack or arrow (see backend.payload)
+# the data can be in dict form or compact form (see backend.types.series.RegularSeries)
 
-@router.post("/")
-async def predict(predict_params: PredictParams) -> PredictResponse:
+
+@router.post("/", response_model=PredictResponse)
+async def predict(request: Request) -> Response:
     # sync
-    pred_res = pred(predict_params)
+    predict_params = await parse_body(request, PredictParams)
+    if predict_mode == "server" and supports_server_pred(predict_params):
+        # in this process, batched with concurrent requests (see backend.batching)
+        pred_res = await server_pred(predict_params)
+    else:
+        pred_res = await pred(predict_params)
     assert isinstance(pred_res, PredictResponse)
-    return pred_res
+    return encode_response(request, pred_res)
+
+
+@router.post("/stream")
+async def stream_predict(request: Request) -> StreamingResponse:
+    """
+    Predictions chunk by chunk while the batches finish (see backend.pred_stream)
+
+    NDJSON of PredStreamChunk items followed by one PredStreamEnd (with the errors) or PredStreamError,
+    or an arrow ipc stream with one record batch per chunk if requested by the accept header.
+    """
+    predict_params = await parse_body(request, PredictParams)
+    task = pred_stream_task.delay(predict_params.model_dump_json())
+    assert isinstance(task.id, str)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if ARROW_MEDIA_TYPE in request.headers.get("accept", ""):
+        return StreamingResponse(
+            arrow_stream(task.id), media_type=ARROW_MEDIA_TYPE, headers=headers
+        )
+    return StreamingResponse(
+        ndjson_stream(task.id), media_type="application/x-ndjson", headers=headers
+    )
+
+
+@router.get("/cache_stats")
+async def get_cache_stats() -> PredCacheStats:
+    """Hits, misses and size of the prediction cache (see backend.pred_cache)"""
+    return await run_in_threadpool(pred_cache.stats)
 
 
 class AsyncResponse(BaseModel):
@@ -25,8 +67,9 @@ class AsyncResponse(BaseModel):
 
 
 @router.post("/async")
-async def async_predict(predict_params: PredictParams) -> AsyncResponse:
-    pred_task = pred(predict_params, sync=False)
+async def async_predict(request: Request) -> AsyncResponse:
+    predict_params = await parse_body(request, PredictParams)
+    pred_task = await pred(predict_params, sync=False)
     assert isinstance(pred_task, AsyncResult)
     assert isinstance(pred_task.id, str)
     return AsyncResponse(task_id=pred_task.id)
@@ -48,7 +91,9 @@ async def predict_progress(task_id: str) -> PredProgressResponse:
     )
 
 
-@router.get("/async/results/{task_id}")
-async def predict_results(task_id: str) -> PredictResponse:
+@router.get("/async/results/{task_id}", response_model=PredictResponse)
+async def predict_results(task_id: str, request: Request) -> Response:
     pred_task = AsyncResult(task_id)
-    return PredictResponse.model_validate_json(pred_task.result)
+    return encode_response(
+        request, PredictResponse.model_validate_json(pred_task.result)
+    )
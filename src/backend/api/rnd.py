@@ -35,7 +35,7 @@ async def getRandomValidDayDate(
     """
     Get random valid day date for the given experiment and app.
     """
-    exp_data = data.get_data(params.exp_name).overlapping_data
+    exp_data = data.get_overlapping_data(params.exp_name)
     matched_app_name = apps.find_matching_app_name_in_data_keys(
         params.exp_name,
         params.app_name,
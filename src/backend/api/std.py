@@ -6,7 +6,7 @@ from pydantic import BaseModel
 import enilm.etypes
 
 from ..mem import cache_folder
-from ..data import get_data
+from ..data import get_resampled_data
 
 router = APIRouter(prefix="/std")
 
@@ -30,7 +30,7 @@ async def getStdWatts(params: StdWattsParams) -> StdWattsResponse:
 
     @memory.cache
     def get_std_watts(params: StdWattsParams) -> StdWattsResponse:
-        data = get_data(params.data_exp_name).resampled_data
+        data = get_resampled_data(params.data_exp_name)
         assert params.app_name in data
         data = data[params.app_name]
 
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from ..progress import task_events
+from ..types.tasks import CeleryTaskId
+
+router = APIRouter(prefix="/tasks")
+
+
+@router.get("/events/{task_id}")
+async def get_task_events(task_id: CeleryTaskId) -> StreamingResponse:
+    """Server-sent progress events of a task (pred, compute_errors, compare_models) followed by its result"""
+    return StreamingResponse(
+        task_events(task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,15 @@
+"""What-if API: predictions for edited mains"""
+
+from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
+
+from ..whatif import whatif
+from ..types.whatif import WhatIfParams, WhatIfResponse
+
+router = APIRouter(prefix="/whatif")
+
+
+@router.post("/")
+async def get_whatif(params: WhatIfParams) -> WhatIfResponse:
+    # only the windows overlapping the edits are re-predicted (in this process)
+    return await run_in_threadpool(whatif, params)
@@ -1,11 +1,11 @@
 import nilmtk
-from typing import Iterable
+from typing import Dict, Iterable
 
 import enilm.appliances
 import enilm.datasets.loaders
 
 from .config import get_config
-
+from .data import peek_hot_exp_data
 
 DATA_APP_NAME_TYPE = str
 
@@ -15,11 +15,26 @@ def find_matching_app_name_in_data_keys(
     data_exp_name: str,
     params_app_name: str,
     data_keys: Iterable[DATA_APP_NAME_TYPE],
+    app_names: Dict[str, DATA_APP_NAME_TYPE] | None = None,
 ) -> DATA_APP_NAME_TYPE:
+    """
+    Key of the app in the data
+
+    The matches are kept in `app_names` of the data the keys belong to (e.g. of the series
+    store), by default in the in-memory data of the exp if loaded (see backend.exp_data_cache).
+    """
     # in case of "mains" or exact match
+    data_keys = list(data_keys)
     if params_app_name in data_keys:
         return params_app_name
 
+    # resolved before for the same data
+    if app_names is None:
+        hot = peek_hot_exp_data(data_exp_name)
+        app_names = hot.app_names if hot is not None else None
+    if app_names is not None and app_names.get(params_app_name) in data_keys:
+        return app_names[params_app_name]
+
     # find matching between:
     # 1. provided app_name and
     # 2. the available apps (keys) in the data
@@ -55,4 +70,7 @@ def find_matching_app_name_in_data_keys(
     if not found_matching_app:
         raise ValueError(f"App {params_app_name} not found in data")
 
+    if app_names is not None:
+        app_names[params_app_name] = app_in_data
+
     return app_in_data
@@ -0,0 +1,194 @@
+# inference server mode: windows of concurrent predict requests for the same model exp
+# are combined into shared forward passes (dynamic micro-batching)
+
+import os
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Tuple
+
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+import enilm.norm
+
+from . import exps
+from .utils import get_device
+from .export import get_inference_model
+from .quant import use_quantized
+from .pred_cache import pred_cache, get_cached_pred
+from .windows import padded_windows, strided_ds_classes
+from .types.pred import PredictParams, PredictResponse
+from .types.series import series_values
+from .tasks.pred import to_predict_response
+from .tasks.quant import enqueue_quant_report
+
+load_dotenv()
+
+# "celery": each sync prediction is a celery task, "server": predictions run in the api process with micro-batching
+predict_mode = os.environ.get("PREDICT_MODE", "celery")
+
+# max. number of windows in one forward pass
+microbatch_max_batch_size = int(os.environ.get("MICROBATCH_MAX_BATCH_SIZE", 1024))
+
+# max. time (in ms) a request waits for other requests to join its forward pass
+microbatch_max_delay_ms = float(os.environ.get("MICROBATCH_MAX_DELAY_MS", 5))
+
+
+@dataclass
+class _Request:
+    windows: torch.Tensor  # (n, 1, sequence_length)
+    future: asyncio.Future
+    dispatched: int = 0  # number of windows already predicted
+    outputs: List[np.ndarray] = field(default_factory=list)
+
+
+class MicroBatcher:
+    """Combines the windows of queued requests for one model into batches of up to `max_batch_size`"""
+
+    def __init__(
+        self, exp_name: str, quantized: bool, max_batch_size: int, max_delay: float
+    ):
+        self.exp_name = exp_name
+        self.quantized = quantized
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay  # seconds
+        self.device = get_device()
+        self.queue: Deque[_Request] = deque()
+        self.new_request = asyncio.Event()
+        # forward passes run one at a time outside the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.worker: asyncio.Task | None = None
+
+    async def predict(self, windows: torch.Tensor) -> np.ndarray:
+        if windows.size(0) == 0:
+            return np.zeros(0, dtype=np.float32)
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append(_Request(windows=windows, future=future))
+        self.new_request.set()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        return await future
+
+    def _n_pending(self) -> int:
+        return sum(r.windows.size(0) - r.dispatched for r in self.queue)
+
+    def _next_parts(self) -> List[Tuple[_Request, int]]:
+        """Windows of the queued requests for the next batch, (request, number of windows)"""
+        # equal share per request first -> a large request does not hold back the ones queued after it
+        requests = list(self.queue)[: self.max_batch_size]
+        pending = [r.windows.size(0) - r.dispatched for r in requests]
+        share = self.max_batch_size // len(requests)
+        takes = [min(share, n) for n in pending]
+        # the rest of the batch in queue order
+        room = self.max_batch_size - sum(takes)
+        for i, n in enumerate(pending):
+            extra = min(room, n - takes[i])
+            takes[i] += extra
+            room -= extra
+        return [(r, k) for r, k in zip(requests, takes) if k > 0]
+
+    def _forward(self, windows: List[torch.Tensor]) -> np.ndarray:
+        model = get_inference_model(
+            self.exp_name, self.device, quantized=self.quantized
+        )
+        with torch.inference_mode():
+            batch = torch.cat(windows).to(self.device)
+            return model(batch).cpu().numpy().flatten()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while len(self.queue) > 0:
+            # wait for other requests to join unless the batch is already full
+            deadline = loop.time() + self.max_delay
+            while self._n_pending() < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.new_request.clear()
+                try:
+                    await asyncio.wait_for(self.new_request.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            parts = self._next_parts()
+            windows = [r.windows[r.dispatched : r.dispatched + k] for r, k in parts]
+            try:
+                # the batch is built in the executor too, not in the event loop
+                outputs = await loop.run_in_executor(
+                    self.executor, self._forward, windows
+                )
+            except Exception as e:
+                for request, _ in parts:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                    self.queue.remove(request)
+                continue
+
+            # split the outputs back to the requests
+            offset = 0
+            for request, k in parts:
+                request.outputs.append(outputs[offset : offset + k])
+                request.dispatched += k
+                offset += k
+                if request.dispatched == request.windows.size(0):
+                    self.queue.remove(request)
+                    if not request.future.done():
+                        request.future.set_result(np.concatenate(request.outputs))
+
+
+_batchers: Dict[Tuple[str, bool], MicroBatcher] = {}
+
+
+def get_batcher(exp_name: str, quantized: bool) -> MicroBatcher:
+    key = (exp_name, quantized)
+    if key not in _batchers:
+        _batchers[key] = MicroBatcher(
+            exp_name,
+            quantized,
+            max_batch_size=microbatch_max_batch_size,
+            max_delay=microbatch_max_delay_ms / 1000,
+        )
+    return _batchers[key]
+
+
+def supports_server_pred(predict_params: PredictParams) -> bool:
+    exp = exps.get_model_exp_by_name(predict_params.model_exp_name)
+    return exp.ds_class in strided_ds_classes
+
+
+async def server_pred(predict_params: PredictParams) -> PredictResponse:
+    """Same result as the pred task, computed in this process with micro-batching"""
+    # hashing the data and the index and files of the cache in the threadpool, not in the event loop
+    key, cached = await run_in_threadpool(get_cached_pred, predict_params)
+    if cached is not None:
+        return cached
+
+    exp: exps.ModelExp = exps.get_model_exp_by_name(predict_params.model_exp_name)
+
+    def _windows() -> torch.Tensor:
+        data_np = series_values(predict_params.data)
+        data_normalized = np.array(
+            enilm.norm.normalize(data_np, exp.mains_norm_params), dtype=np.float32
+        )
+        return padded_windows(data_normalized, exp.sequence_length)
+
+    def _response(preds: np.ndarray) -> PredictResponse:
+        preds_flat_denorm: np.ndarray = np.array(
+            enilm.norm.denormalize(preds, exp.app_norm_params)
+        )
+        return to_predict_response(predict_params, exp, preds_flat_denorm)
+
+    # array work in the threadpool, only the batching in the event loop
+    windows = await run_in_threadpool(_windows)
+    quantized = use_quantized(exp.exp_name, predict_params.quantized)
+    if quantized and get_device().type == "cpu":
+        # built by a worker, not in the request path
+        await run_in_threadpool(enqueue_quant_report, exp.exp_name)
+    preds = await get_batcher(exp.exp_name, quantized).predict(windows)
+    res = await run_in_threadpool(_response, preds)
+    await run_in_threadpool(pred_cache.put, key, res)
+    return res
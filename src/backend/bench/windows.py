@@ -0,0 +1,74 @@
+"""
+Benchmark the strided windows against the DataLoader over the exp's ds_class
+
+Usage (from src/): python -m backend.bench.windows --n-samples 525600
+"""
+
+import argparse
+import time
+from typing import Callable, Iterator
+
+import numpy as np
+import torch
+import torch.nn as nn
+from enilm.models.torch.seq import S2P, S2PDatasetMains
+
+from ..windows import iter_strided_batches, iter_ds_class_batches
+
+
+def run(
+    model: nn.Module,
+    batches: Callable[[], Iterator[torch.Tensor]],
+) -> tuple[float, float, np.ndarray]:
+    """(seconds spent building batches, total seconds, predictions)"""
+    preds = []
+    batches_time = 0.0
+    start = time.perf_counter()
+    with torch.inference_mode():
+        batches_iter = batches()
+        while True:
+            batch_start = time.perf_counter()
+            inputs = next(batches_iter, None)
+            batches_time += time.perf_counter() - batch_start
+            if inputs is None:
+                break
+            preds.append(model(inputs).numpy().flatten())
+    return batches_time, time.perf_counter() - start, np.concatenate(preds)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-samples", type=int, default=60 * 24 * 30)
+    parser.add_argument("--seq-len", type=int, default=599)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = S2P(args.seq_len)
+    model.eval()
+    mains = np.random.default_rng(0).normal(size=args.n_samples).astype(np.float32)
+
+    ds_batches_time, ds_time, ds_preds = run(
+        model,
+        lambda: iter_ds_class_batches(
+            S2PDatasetMains, mains, args.seq_len, args.batch_size
+        ),
+    )
+    strided_batches_time, strided_time, strided_preds = run(
+        model,
+        lambda: iter_strided_batches(mains, args.seq_len, args.batch_size),
+    )
+
+    print(
+        f"samples: {args.n_samples}, seq_len: {args.seq_len}, batch_size: {args.batch_size}"
+    )
+    print(f"ds_class: {ds_time:.2f}s total, {ds_batches_time:.2f}s building batches")
+    print(
+        f"strided:  {strided_time:.2f}s total, {strided_batches_time:.2f}s building batches"
+    )
+    print(f"speedup:  {ds_time / strided_time:.2f}x")
+    print(f"max abs diff: {np.max(np.abs(ds_preds - strided_preds))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, ConfigDict
+from functools import cached_property
+from pathlib import Path
 
 import enilm.etypes.ser
 import enilm.yaml.config
@@ -8,40 +9,132 @@ import enilm.yaml.daily.split
 
 from .config import get_config
 from .mem import get_exp_mem
+from . import exp_data_cache
+from .exp_data_cache import HotExpData
 
+# each stage of the exp data is cached on its own (joblib memory of the exp) and only
+# computed or loaded when asked for. Stages depending on others get them from their
+# getters, e.g. the xy arrays load the train/test split, which loads the cleaned days.
 
-class GetDataResult(BaseModel):
-    model_config = ConfigDict(arbitrary_types_allowed=True)
-    raw_data: enilm.yaml.data.RawData
-    resampled_data: enilm.yaml.data.RawData
-    overlapping_data: enilm.yaml.data.RawData
-    each_day_cleaned: enilm.yaml.daily.DailyData
-    each_day_cleaned_traintest: enilm.yaml.daily.split.DailySplit
-    xy_cleaned: enilm.yaml.daily.split.XYNP
 
+def _raw(config: enilm.yaml.config.Config) -> enilm.yaml.data.RawData:
+    return enilm.yaml.data.raw(config)
 
-def get_data(exp_name: str) -> GetDataResult:
+
+def _resampled(config: enilm.yaml.config.Config) -> enilm.yaml.data.RawData:
+    return enilm.yaml.data.resample(config)
+
+
+def _overlapping(config: enilm.yaml.config.Config) -> enilm.yaml.data.RawData:
+    return enilm.yaml.data.overlapping(config)
+
+
+def _each_day_cleaned(config: enilm.yaml.config.Config) -> enilm.yaml.daily.DailyData:
+    return enilm.yaml.daily.clean(config)
+
+
+def _each_day_cleaned_traintest(
+    exp_name: str, config: enilm.yaml.config.Config
+) -> enilm.yaml.daily.split.DailySplit:
+    return enilm.yaml.daily.split.train_test(get_each_day_cleaned(exp_name), config)
+
+
+def _xy_cleaned(
+    exp_name: str, config: enilm.yaml.config.Config
+) -> enilm.yaml.daily.split.XYNP:
+    return enilm.yaml.daily.split.traintest_xy(get_each_day_cleaned_traintest(exp_name))
+
+
+def get_raw_data(exp_name: str) -> enilm.yaml.data.RawData:
+    memory = get_exp_mem(exp_name).memory
+    return memory.cache(_raw)(get_config(exp_name))
+
+
+def get_resampled_data(exp_name: str) -> enilm.yaml.data.RawData:
+    memory = get_exp_mem(exp_name).memory
+    return memory.cache(_resampled)(get_config(exp_name))
+
+
+def get_overlapping_data(exp_name: str) -> enilm.yaml.data.RawData:
+    """
+    Resampled series of mains and apps over their common time range (used by most endpoints)
+
+    Kept in memory for recently used exps, see backend.exp_data_cache. The series are
+    shared between callers and must not be modified.
+    """
+    return get_hot_exp_data(exp_name).overlapping_data
+
+
+def _stored_path(cached, *args) -> Path:
+    # output file of the joblib cache entry of the call
+    func_id, args_id = cached._get_output_identifiers(*args)
+    return Path(cached.store_backend.location, func_id, args_id, "output.pkl")
+
+
+def get_hot_exp_data(exp_name: str) -> HotExpData:
     config = get_config(exp_name)
-    exp_mem = get_exp_mem(exp_name).memory
-
-    @exp_mem.cache()
-    def inner_get_data(config: enilm.yaml.config.Config) -> GetDataResult:
-        raw_data: enilm.yaml.data.RawData = enilm.yaml.data.raw(config)
-        resampled_data = enilm.yaml.data.resample(config)
-        overlapping_data = enilm.yaml.data.overlapping(config)
-        each_day_cleaned = enilm.yaml.daily.clean(config)
-        each_day_cleaned_traintest = enilm.yaml.daily.split.train_test(
-            each_day_cleaned, config
-        )
-        xy_cleaned = enilm.yaml.daily.split.traintest_xy(each_day_cleaned_traintest)
-
-        return GetDataResult(
-            raw_data=raw_data,
-            resampled_data=resampled_data,
-            overlapping_data=overlapping_data,
-            each_day_cleaned=each_day_cleaned,
-            each_day_cleaned_traintest=each_day_cleaned_traintest,
-            xy_cleaned=xy_cleaned,
-        )
-
-    return inner_get_data(config)
+    cached = get_exp_mem(exp_name).memory.cache(_overlapping)
+    return exp_data_cache.get_hot_exp_data(
+        exp_name,
+        _stored_path(cached, config),
+        load=lambda: cached(config),
+        is_stored=lambda: cached.check_call_in_cache(config),
+    )
+
+
+def peek_hot_exp_data(exp_name: str) -> HotExpData | None:
+    """In-memory overlapping data of the exp if already loaded, see `get_hot_exp_data`"""
+    config = get_config(exp_name)
+    cached = get_exp_mem(exp_name).memory.cache(_overlapping)
+    return exp_data_cache.peek_hot_exp_data(exp_name, _stored_path(cached, config))
+
+
+def get_each_day_cleaned(exp_name: str) -> enilm.yaml.daily.DailyData:
+    memory = get_exp_mem(exp_name).memory
+    return memory.cache(_each_day_cleaned)(get_config(exp_name))
+
+
+def get_each_day_cleaned_traintest(exp_name: str) -> enilm.yaml.daily.split.DailySplit:
+    memory = get_exp_mem(exp_name).memory
+    return memory.cache(_each_day_cleaned_traintest)(exp_name, get_config(exp_name))
+
+
+def get_xy_cleaned(exp_name: str) -> enilm.yaml.daily.split.XYNP:
+    memory = get_exp_mem(exp_name).memory
+    return memory.cache(_xy_cleaned)(exp_name, get_config(exp_name))
+
+
+class ExpData:
+    """All stages of the exp data, each one loaded on first access"""
+
+    def __init__(self, exp_name: str):
+        self.exp_name = exp_name
+
+    @cached_property
+    def raw_data(self) -> enilm.yaml.data.RawData:
+        return get_raw_data(self.exp_name)
+
+    @cached_property
+    def resampled_data(self) -> enilm.yaml.data.RawData:
+        return get_resampled_data(self.exp_name)
+
+    @cached_property
+    def overlapping_data(self) -> enilm.yaml.data.RawData:
+        return get_overlapping_data(self.exp_name)
+
+    @cached_property
+    def each_day_cleaned(self) -> enilm.yaml.daily.DailyData:
+        return get_each_day_cleaned(self.exp_name)
+
+    @cached_property
+    def each_day_cleaned_traintest(self) -> enilm.yaml.daily.split.DailySplit:
+        return get_each_day_cleaned_traintest(self.exp_name)
+
+    @cached_property
+    def xy_cleaned(self) -> enilm.yaml.daily.split.XYNP:
+        return get_xy_cleaned(self.exp_name)
+
+
+def get_data(exp_name: str) -> ExpData:
+    # prefer the getter of the needed stage, e.g. `get_overlapping_data`
+    return ExpData(exp_name)
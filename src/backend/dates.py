@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from enilm.yaml.config import DayDate
 
 from .mem import exp_start_end_dates_memory
-from .data import get_data
+from .data import get_each_day_cleaned_traintest
 
 
 @dataclass
@@ -17,7 +17,7 @@ class ExpStartEndDates:
 @exp_start_end_dates_memory.cache
 def get_start_end_dates_for_exp(exp_name: str) -> ExpStartEndDates:
     # get start/end dates for each experiment
-    each_day_data = get_data(exp_name).each_day_cleaned_traintest
+    each_day_data = get_each_day_cleaned_traintest(exp_name)
     train_days = list(each_day_data.train["mains"].keys())
     test_days = list(each_day_data.test["mains"].keys())
     
@@ -0,0 +1,261 @@
+# min/max/mean pyramid (power-of-two buckets) of stored series, for charts with at most N points of any range
+
+import os
+import shutil
+import tempfile
+from enum import Enum
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from .utils import LRUCache
+
+load_dotenv()
+
+# buckets of 2**k samples for k >= pyramid_min_level (stored), smaller ones are computed from the samples
+pyramid_min_level = 4
+
+# no stored levels with less buckets than this
+pyramid_min_buckets = 64
+
+pyramid_arrays = ("min", "max", "mean", "argmin", "argmax")
+
+# max. number of loaded pyramids (and their values) kept by each process (LRU eviction)
+pyramid_cache_size = int(os.environ.get("PYRAMID_CACHE_SIZE", 64))
+
+
+class DownsampleMode(str, Enum):
+    MINMAX = "minmax"  # min and max of each bucket at their timestamps (peaks are kept)
+    MEAN = "mean"  # mean of each bucket at its first timestamp
+    LTTB = "lttb"  # largest triangle three buckets over the min/max points
+
+
+@dataclass
+class Buckets:
+    """Buckets of consecutive samples, argmin/argmax are sample positions"""
+
+    min: np.ndarray
+    max: np.ndarray
+    mean: np.ndarray
+    argmin: np.ndarray
+    argmax: np.ndarray
+    start: np.ndarray  # position of the first sample of each bucket
+
+    @staticmethod
+    def concat(*parts: "Buckets") -> "Buckets":
+        return Buckets(
+            **{
+                name: np.concatenate([getattr(part, name) for part in parts])
+                for name in (*pyramid_arrays, "start")
+            }
+        )
+
+
+def reduce_samples(values: np.ndarray, start: int, stop: int, k: int) -> Buckets:
+    """Buckets of the samples [start, stop) aligned to multiples of 2**k (the first and last may be partial)"""
+    size = 2**k
+    if stop <= start:
+        return Buckets(
+            **{
+                name: np.zeros(
+                    0, dtype=np.int64 if name.startswith("arg") else np.float32
+                )
+                for name in pyramid_arrays
+            },
+            start=np.zeros(0, dtype=np.int64),
+        )
+    first = start - start % size
+    n_buckets = -(-(stop - first) // size)
+    padded = np.full(n_buckets * size, np.nan)
+    padded[start - first : stop - first] = values[start:stop]
+    padded = padded.reshape(n_buckets, size)
+    bucket_first = first + np.arange(n_buckets) * size
+    return Buckets(
+        min=np.nanmin(padded, axis=1).astype(np.float32),
+        max=np.nanmax(padded, axis=1).astype(np.float32),
+        mean=np.nanmean(padded, axis=1).astype(np.float32),
+        argmin=bucket_first + np.nanargmin(padded, axis=1),
+        argmax=bucket_first + np.nanargmax(padded, axis=1),
+        start=np.maximum(bucket_first, start),
+    )
+
+
+def _next_level(level: Dict[str, np.ndarray], n: int, k: int) -> Dict[str, np.ndarray]:
+    """Level k + 1 from level k (pairs of buckets, the last one may be alone)"""
+    m = len(level["min"])
+    pad = m % 2
+    size = 2**k
+    counts = np.full(m + pad, size, dtype=np.float64)
+    counts[m - 1] = n - (m - 1) * size
+    counts[m:] = 0
+
+    def pairs(x: np.ndarray, fill) -> np.ndarray:
+        return np.concatenate([x, np.full(pad, fill, dtype=x.dtype)]).reshape(-1, 2)
+
+    mins, maxs = pairs(level["min"], np.inf), pairs(level["max"], -np.inf)
+    argmins, argmaxs = pairs(level["argmin"], 0), pairs(level["argmax"], 0)
+    means = pairs(level["mean"], 0.0)
+    counts = counts.reshape(-1, 2)
+    rows = np.arange(len(mins))
+    min_idx, max_idx = np.argmin(mins, axis=1), np.argmax(maxs, axis=1)
+    return {
+        "min": mins[rows, min_idx].astype(np.float32),
+        "max": maxs[rows, max_idx].astype(np.float32),
+        "mean": (
+            (means.astype(np.float64) * counts).sum(axis=1) / counts.sum(axis=1)
+        ).astype(np.float32),
+        "argmin": argmins[rows, min_idx],
+        "argmax": argmaxs[rows, max_idx],
+    }
+
+
+def build_pyramid(values: np.ndarray) -> Dict[int, Dict[str, np.ndarray]]:
+    n = len(values)
+    levels = {}
+    first = reduce_samples(values, 0, n, pyramid_min_level)
+    level = {name: getattr(first, name) for name in pyramid_arrays}
+    k = pyramid_min_level
+    while len(level["min"]) >= pyramid_min_buckets:
+        levels[k] = level
+        level = _next_level(level, n, k)
+        k += 1
+    return levels
+
+
+def store_pyramid(path: Path, levels: Dict[int, Dict[str, np.ndarray]]):
+    # written to a temp. dir first, as the full predictions (see backend.pred_store)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    for k, level in levels.items():
+        for name in pyramid_arrays:
+            np.save(tmp_path / f"{k}-{name}.npy", level[name])
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_pyramid(path: Path) -> Dict[int, Dict[str, np.ndarray]]:
+    levels: Dict[int, Dict[str, np.ndarray]] = {}
+    for level_path in path.glob("*-min.npy"):
+        k = int(level_path.name.split("-")[0])
+        levels[k] = {
+            name: np.load(path / f"{k}-{name}.npy", mmap_mode="r")
+            for name in pyramid_arrays
+        }
+    return levels
+
+
+@dataclass
+class Pyramid:
+    values: np.ndarray  # the samples
+    levels: Dict[int, Dict[str, np.ndarray]]  # by k, memory-mapped
+
+    def buckets(self, start: int, stop: int, k: int) -> Buckets:
+        """Buckets of 2**k samples of [start, stop), the partial ones at the edges from the samples"""
+        if k not in self.levels:
+            return reduce_samples(self.values, start, stop, k)
+        size = 2**k
+        first_full, last_full = -(-start // size), stop // size
+        if last_full <= first_full:
+            return reduce_samples(self.values, start, stop, k)
+        level = self.levels[k]
+        inner = Buckets(
+            **{
+                name: np.asarray(level[name][first_full:last_full])
+                for name in pyramid_arrays
+            },
+            start=np.arange(first_full, last_full) * size,
+        )
+        return Buckets.concat(
+            reduce_samples(self.values, start, first_full * size, k),
+            inner,
+            reduce_samples(self.values, last_full * size, stop, k),
+        )
+
+    def buckets_within(self, start: int, stop: int, max_buckets: int) -> Buckets:
+        """Buckets of the finest level with at most max_buckets buckets for [start, stop)"""
+        return self.buckets(start, stop, self._level_for(start, stop, max_buckets))
+
+    def _level_for(self, start: int, stop: int, max_buckets: int) -> int:
+        # the finest level with at most max_buckets buckets (incl. the partial ones)
+        max_buckets = max(2, max_buckets)
+        k = 0
+        while -(-(stop - start) // 2**k) + 1 > max_buckets:
+            k += 1
+        return k
+
+    def downsample(
+        self, start: int, stop: int, max_points: int, mode: DownsampleMode
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and values of at most max_points points of the samples [start, stop)"""
+        if stop - start <= max_points:
+            positions = np.arange(start, stop)
+            return positions, np.asarray(self.values[start:stop], dtype=np.float32)
+        if mode is DownsampleMode.MEAN:
+            b = self.buckets(start, stop, self._level_for(start, stop, max_points))
+            return b.start, b.mean
+        if mode is DownsampleMode.MINMAX:
+            b = self.buckets(start, stop, self._level_for(start, stop, max_points // 2))
+            return _minmax_points(b)
+        # lttb over a finer min/max selection
+        b = self.buckets(start, stop, self._level_for(start, stop, 2 * max_points))
+        positions, values = _minmax_points(b)
+        return lttb(positions, values, max_points)
+
+
+def _minmax_points(b: Buckets) -> Tuple[np.ndarray, np.ndarray]:
+    positions = np.stack([b.argmin, b.argmax], axis=1)
+    values = np.stack([b.min, b.max], axis=1)
+    # in time order within each bucket, a flat bucket gives one point
+    order = np.argsort(positions, axis=1)
+    positions = np.take_along_axis(positions, order, axis=1).ravel()
+    values = np.take_along_axis(values, order, axis=1).ravel()
+    keep = np.append(True, positions[1:] != positions[:-1])
+    return positions[keep], values[keep]
+
+
+def lttb(
+    positions: np.ndarray, values: np.ndarray, n_out: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest triangle three buckets (Steinarsson, 2013), keeps the first and last point"""
+    n = len(positions)
+    if n <= n_out or n_out < 3:
+        return positions, values
+    x = positions.astype(np.float64)
+    y = values.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.zeros(n_out, dtype=np.int64)
+    prev = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # average of the next bucket (the last point for the last bucket)
+        next_lo, next_hi = hi, edges[b + 2] if b + 2 < n_out - 1 else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        areas = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        prev = lo + int(np.argmax(areas))
+        selected[b + 1] = prev
+    selected[-1] = n - 1
+    return positions[selected], values[selected]
+
+
+# loaded pyramids of this process by path
+_pyramids: LRUCache[Pyramid] = LRUCache(pyramid_cache_size)
+
+
+def get_pyramid(path: Path, values: np.ndarray) -> Pyramid:
+    """Pyramid of the (stored) values, built once and stored at path"""
+    pyramid = _pyramids.get(path)
+    if pyramid is not None:
+        return pyramid
+    if not path.exists():
+        store_pyramid(path, build_pyramid(values))
+    pyramid = Pyramid(values=values, levels=load_pyramid(path))
+    _pyramids.put(path, pyramid)
+    return pyramid
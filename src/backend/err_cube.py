@@ -0,0 +1,180 @@
+# error sums by calendar day and hour of day, built once per full prediction from its error index
+
+import os
+from enum import Enum
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, List
+
+import holidays
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from enilm.dt.workday import get_holidays_calendar_from_ds
+
+from . import exps
+from .mem import get_exp_mem
+from .metrics import ErrSums
+from .model import get_weights_hash
+from .utils import LRUCache
+from .err_index import ErrIndex, err_index_arrays, get_err_index
+
+load_dotenv()
+
+# part of the stored file name, increased when the stored arrays change
+# (2: local hours of the named tz, cubes of 1 were binned on a fixed utc offset)
+err_cube_version = 2
+
+# max. number of loaded error cubes kept by each process (LRU eviction)
+err_cube_cache_size = int(os.environ.get("ERR_CUBE_CACHE_SIZE", 64))
+
+
+class DayType(str, Enum):
+    WEEKDAY = "weekday"
+    WEEKEND = "weekend"
+    HOLIDAY = "holiday"  # takes precedence over weekday/weekend
+
+
+@dataclass
+class ErrCube:
+    days: np.ndarray  # datetime64[D], consecutive local days of the prediction
+    sums: ErrSums  # arrays of shape (days, 24)
+
+    def by_day_type(self, day_types: List[DayType]) -> Dict[DayType, ErrSums]:
+        """Error sums by hour of day (arrays of shape (24,)) of the days of each type"""
+
+        def of_type(day_type: DayType) -> np.ndarray:
+            return np.array([t is day_type for t in day_types], dtype=bool)
+
+        return {
+            day_type: ErrSums(
+                **{
+                    name: getattr(self.sums, name)[of_type(day_type)].sum(axis=0)
+                    for name in ("n", *err_index_arrays)
+                }
+            )
+            for day_type in DayType
+        }
+
+
+def build_err_cube(err_index: ErrIndex) -> ErrCube:
+    """
+    Sums of each (local) hour from the prefix sums, no pass over the samples
+
+    Hours are taken in UTC and converted to the local time of the index (whole-hour offsets),
+    hours repeated on DST changes are added to the same cell.
+    """
+    index = err_index.index
+    if len(index) == 0:
+        return ErrCube(
+            days=np.zeros(0, dtype="datetime64[D]"),
+            sums=ErrSums(
+                **{name: np.zeros((0, 24)) for name in ("n", *err_index_arrays)}
+            ),
+        )
+
+    utc = index.tz_convert("UTC") if index.tz is not None else index
+    hour_starts = pd.date_range(utc[0].floor("h"), utc[-1].floor("h"), freq="h")
+    starts = utc.searchsorted(hour_starts, "left")
+    stops = np.append(starts[1:], len(index))
+
+    local = hour_starts.tz_convert(index.tz) if index.tz is not None else hour_starts
+    local_days = local.tz_localize(None).normalize().values.astype("datetime64[D]")
+    day_idx = (local_days - local_days[0]).astype(np.int64)
+    n_days = int(day_idx[-1]) + 1
+    cells = day_idx * 24 + local.hour.to_numpy()
+
+    hour_sums = err_index.range_sums(starts, stops)
+
+    def to_cells(values: np.ndarray) -> np.ndarray:
+        dense = np.zeros(n_days * 24, dtype=values.dtype)
+        np.add.at(dense, cells, values)
+        return dense.reshape(n_days, 24)
+
+    return ErrCube(
+        days=local_days[0] + np.arange(n_days),
+        sums=ErrSums(
+            **{
+                name: to_cells(np.asarray(getattr(hour_sums, name)))
+                for name in ("n", *err_index_arrays)
+            }
+        ),
+    )
+
+
+def get_err_cube_path(err_index_path: Path) -> Path:
+    # next to the arrays of the error index
+    return err_index_path / f"cube{err_cube_version}.npz"
+
+
+def store_err_cube(path: Path, cube: ErrCube):
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npz")
+    np.savez(
+        tmp_path,
+        days=cube.days,
+        **{name: getattr(cube.sums, name) for name in ("n", *err_index_arrays)},
+    )
+    tmp_path.replace(path)
+
+
+def load_err_cube(path: Path) -> ErrCube:
+    with np.load(path) as stored:
+        return ErrCube(
+            days=stored["days"],
+            sums=ErrSums(**{name: stored[name] for name in ("n", *err_index_arrays)}),
+        )
+
+
+# loaded cubes of this process by (data exp, app, model exp, weights hash)
+_err_cubes: LRUCache[ErrCube] = LRUCache(err_cube_cache_size)
+
+
+def get_err_cube(
+    data_exp_name: str,
+    app_name: str,
+    model_exp_name: str | None = None,
+) -> ErrCube:
+    """
+    Error cube of the full prediction, built once per prediction
+
+    Blocking (may compute the full prediction), use `run_in_threadpool` in async handlers.
+    """
+    if model_exp_name is None:
+        model_exp_name = data_exp_name
+    key = (data_exp_name, app_name, model_exp_name, get_weights_hash(model_exp_name))
+    cube = _err_cubes.get(key)
+    if cube is not None:
+        return cube
+
+    err_index = get_err_index(data_exp_name, app_name, model_exp_name)
+    assert err_index.path is not None
+    path = get_err_cube_path(err_index.path)
+    if path.exists():
+        cube = load_err_cube(path)
+    else:
+        cube = build_err_cube(err_index)
+        store_err_cube(path, cube)
+    _err_cubes.put(key, cube)
+    return cube
+
+
+def get_day_types(exp_name: str, days: np.ndarray) -> List[DayType]:
+    """Holidays from the calendar of the exp's dataset (see backend.api.day_info)"""
+    exp: exps.Exp = exps.get_exp_by_name(exp_name)
+    exp_mem = get_exp_mem(exp_name).memory
+
+    @exp_mem.cache
+    def get_exp_holidays_cal(ds) -> holidays.HolidayBase:
+        return get_holidays_calendar_from_ds(ds)
+
+    cal = get_exp_holidays_cal(exp.dataset)
+    day_types = []
+    for day in pd.DatetimeIndex(days):
+        if day.date() in cal:
+            day_types.append(DayType.HOLIDAY)
+        elif day.weekday() >= 5:
+            day_types.append(DayType.WEEKEND)
+        else:
+            day_types.append(DayType.WEEKDAY)
+    return day_types
@@ -0,0 +1,253 @@
+# prefix sums of the errors of a stored full prediction: all errors of any range or window in O(1)
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from . import apps
+from . import exps
+from .data import get_overlapping_data
+from .metrics import ErrSums, split_errors
+from .model import get_weights_hash
+from .pred import full_pred
+from .pred_store import FullPred
+from .utils import LRUCache
+from .types.err import ErrType, SplitErrors
+
+load_dotenv()
+
+err_index_arrays = ("abs_err", "sq_err", "gt", "pr", "gt_sq", "tp", "fp", "fn")
+
+# part of the stored path, increased when the arrays change
+err_index_version = 2
+
+# max. number of opened error indexes kept by each process (LRU eviction)
+err_index_cache_size = int(os.environ.get("ERR_INDEX_CACHE_SIZE", 64))
+
+
+@dataclass
+class ErrIndex:
+    """
+    Prefix sums (n + 1 values, starting with 0) over the samples of a full prediction
+
+    float64 for the errors and energies, int64 for the on/off confusion counts.
+    """
+
+    abs_err: np.ndarray
+    sq_err: np.ndarray
+    gt: np.ndarray
+    pr: np.ndarray
+    gt_sq: np.ndarray
+    tp: np.ndarray
+    fp: np.ndarray
+    fn: np.ndarray
+    index: pd.DatetimeIndex
+    path: Path | None = None  # stored index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def sums(self, start: int, stop: int) -> ErrSums:
+        """Error sums of the samples [start, stop)"""
+        return ErrSums(
+            n=stop - start,
+            **{
+                name: getattr(self, name)[stop].item()
+                - getattr(self, name)[start].item()
+                for name in err_index_arrays
+            },
+        )
+
+    def split_errors(
+        self, train_size: int, err_types: Iterable[ErrType] = ErrType
+    ) -> SplitErrors:
+        """Errors of the train ([0, train_size)), test and all samples"""
+        return split_errors(
+            self.sums(0, train_size), self.sums(train_size, len(self)), err_types
+        )
+
+    def range_sums(self, starts: np.ndarray, stops: np.ndarray) -> ErrSums:
+        """Error sums (arrays) of the samples [starts[i], stops[i]) of each range i"""
+        return ErrSums(
+            n=stops - starts,
+            **{
+                name: getattr(self, name)[stops] - getattr(self, name)[starts]
+                for name in err_index_arrays
+            },
+        )
+
+    def window_errors(
+        self,
+        start: int,
+        stop: int,
+        window: int,
+        err_types: Iterable[ErrType] = ErrType,
+    ) -> Dict[ErrType, np.ndarray]:
+        """Errors (float32) of each window of length `window` starting in [start, stop - window]"""
+        if stop - start < window:
+            return {err_type: np.zeros(0, dtype=np.float32) for err_type in err_types}
+        window_sums = self.range_sums(
+            np.arange(start, stop - window + 1), np.arange(start + window, stop + 1)
+        )
+        return {
+            err_type: np.asarray(values, dtype=np.float32)
+            for err_type, values in window_sums.metrics(err_types).items()
+        }
+
+    def range_slice(self, start: pd.Timestamp, end: pd.Timestamp) -> Tuple[int, int]:
+        """Samples [start, stop) within the (inclusive) time range"""
+        return (
+            int(self.index.searchsorted(start, "left")),
+            int(self.index.searchsorted(end, "right")),
+        )
+
+
+def build_err_index(
+    gt: np.ndarray, pr: np.ndarray, on_power_threshold: float
+) -> Dict[str, np.ndarray]:
+    gt_on = gt > on_power_threshold
+    pr_on = pr > on_power_threshold
+    gt64 = gt.astype(np.float64)
+    err = gt64 - pr
+
+    def prefix(x: np.ndarray, dtype) -> np.ndarray:
+        return np.concatenate(([0], np.cumsum(x, dtype=dtype)))
+
+    return {
+        "abs_err": prefix(np.abs(err), np.float64),
+        "sq_err": prefix(np.square(err), np.float64),
+        "gt": prefix(gt64, np.float64),
+        "pr": prefix(pr, np.float64),
+        "gt_sq": prefix(np.square(gt64), np.float64),
+        "tp": prefix(gt_on & pr_on, np.int64),
+        "fp": prefix(~gt_on & pr_on, np.int64),
+        "fn": prefix(gt_on & ~pr_on, np.int64),
+    }
+
+
+def get_err_index_path(
+    pred: FullPred, app_name: str, on_power_threshold: float
+) -> Path:
+    # next to the stored prediction (keyed by data exp, model exp and weights)
+    return pred.path / f"err_index{err_index_version}-{app_name}-{on_power_threshold:g}"
+
+
+def store_err_index(path: Path, arrays: Dict[str, np.ndarray]):
+    # written to a temp. dir first, as the full predictions (see backend.pred_store)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    for name in err_index_arrays:
+        np.save(tmp_path / f"{name}.npy", arrays[name])
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def open_err_index(
+    pred: FullPred,
+    app_name: str,
+    on_power_threshold: float,
+    load_gt: Callable[[], np.ndarray],
+) -> ErrIndex:
+    """Memory-mapped error index of the prediction, the gt is only loaded if it has to be built"""
+    path = get_err_index_path(pred, app_name, on_power_threshold)
+    if not path.exists():
+        store_err_index(
+            path, build_err_index(load_gt(), pred.values, on_power_threshold)
+        )
+    arrays = {
+        name: np.load(path / f"{name}.npy", mmap_mode="r") for name in err_index_arrays
+    }
+    return ErrIndex(**arrays, index=pred.index(), path=path)
+
+
+# loaded (memory-mapped) indexes of this process by (data exp, app, model exp, weights hash, threshold)
+_err_indexes: LRUCache[ErrIndex] = LRUCache(err_index_cache_size)
+
+
+def get_err_index(
+    data_exp_name: str,
+    app_name: str,
+    model_exp_name: str | None = None,
+    on_power_threshold: float | None = None,
+) -> ErrIndex:
+    """
+    Error index of the full prediction, built once per prediction and on-power threshold
+
+    The threshold defaults to the one of the data exp (as the total errors always did).
+    Blocking (may compute the full prediction), use `run_in_threadpool` in async handlers.
+    """
+    if model_exp_name is None:
+        model_exp_name = data_exp_name
+    if on_power_threshold is None:
+        on_power_threshold = exps.get_exp_by_name(data_exp_name).on_power_threshold
+    key = (
+        data_exp_name,
+        app_name,
+        model_exp_name,
+        get_weights_hash(model_exp_name),
+        on_power_threshold,
+    )
+    err_index = _err_indexes.get(key)
+    if err_index is not None:
+        return err_index
+
+    data = get_overlapping_data(data_exp_name)
+    matched_app_name = apps.find_matching_app_name_in_data_keys(
+        data_exp_name,
+        app_name,
+        data.keys(),
+    )
+    pred = full_pred(
+        data_exp_name=data_exp_name,
+        app_name=matched_app_name,
+        model_exp_name=model_exp_name,
+        data=data,
+    )
+    err_index = open_err_index(
+        pred,
+        matched_app_name,
+        on_power_threshold,
+        lambda: data[matched_app_name].to_numpy(dtype=np.float32),
+    )
+    _err_indexes.put(key, err_index)
+    return err_index
+
+
+@dataclass
+class SortedErrors:
+    """Window errors sorted once, the windows with an error in any band are a contiguous slice"""
+
+    sorted_errors: np.ndarray
+    order: np.ndarray  # window idx of each sorted error
+
+    @classmethod
+    def of(cls, errors: np.ndarray) -> "SortedErrors":
+        order = np.argsort(errors, kind="stable")
+        return cls(sorted_errors=np.asarray(errors)[order], order=order)
+
+    def band(self, err_min: float, err_max: float) -> Tuple[int, int]:
+        """Positions [lo, hi) of the sorted errors within [err_min, err_max]"""
+        lo = int(np.searchsorted(self.sorted_errors, err_min, "left"))
+        hi = int(np.searchsorted(self.sorted_errors, err_max, "right"))
+        return lo, max(lo, hi)
+
+    def sample(
+        self,
+        err_min: float,
+        err_max: float,
+        k: int = 1,
+        rng: np.random.Generator | None = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Up to k distinct random windows (idx and error) with an error in [err_min, err_max]"""
+        rng = rng if rng is not None else np.random.default_rng()
+        lo, hi = self.band(err_min, err_max)
+        picked = lo + rng.choice(hi - lo, size=min(k, hi - lo), replace=False)
+        return self.order[picked], self.sorted_errors[picked]
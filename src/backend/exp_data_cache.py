@@ -0,0 +1,147 @@
+# process-level LRU of decoded exp data (overlapping series, matched app names, time index) within a byte budget
+
+import os
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Tuple
+
+import pandas as pd
+from dotenv import load_dotenv
+from loguru import logger
+
+import enilm.yaml.data
+
+from .mem import cache_folder
+
+load_dotenv()
+
+# max. bytes of the overlapping data kept in memory, least recently used exps are evicted
+exp_data_cache_max_bytes = int(os.environ.get("EXP_DATA_CACHE_MAX_BYTES", 2 * 1024**3))
+
+
+def _stat_key(path: Path) -> Tuple[int, int] | None:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def data_nbytes(data: enilm.yaml.data.RawData) -> int:
+    return sum(int(ser.memory_usage(index=True, deep=False)) for ser in data.values())
+
+
+@dataclass
+class HotExpData:
+    overlapping_data: enilm.yaml.data.RawData
+    nbytes: int
+    version: Tuple  # see ExpDataCache.version
+    # requested app name -> key in the data (see backend.apps)
+    app_names: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return self.overlapping_data["mains"].index  # type: ignore
+
+
+class ExpDataCache:
+    """
+    Overlapping data of the recently used exps, evicted by byte budget (least recently used first)
+
+    An entry is dropped when the exp file or the stored data (output file of the joblib cache
+    entry) change, checked on each access by their mtime/size without reading, or when the
+    cached stage is no longer in its joblib memory.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, HotExpData] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version(stored_path: Path) -> Tuple:
+        # the stored file the data is read from, a rewrite changes its mtime/size
+        return (
+            _stat_key(cache_folder / "exp.json"),
+            _stat_key(stored_path),
+        )
+
+    def get(self, exp_name: str, version: Tuple) -> HotExpData | None:
+        with self._lock:
+            entry = self._entries.get(exp_name)
+            if entry is None:
+                return None
+            if entry.version != version:
+                logger.info(f"Exp data of {exp_name} changed, dropped from cache")
+                del self._entries[exp_name]
+                return None
+            self._entries.move_to_end(exp_name)
+            return entry
+
+    def put(self, exp_name: str, entry: HotExpData):
+        with self._lock:
+            self._entries[exp_name] = entry
+            self._entries.move_to_end(exp_name)
+            total = sum(e.nbytes for e in self._entries.values())
+            # the newest entry is kept even if it alone exceeds the budget
+            while total > self.max_bytes and len(self._entries) > 1:
+                evicted_name, evicted = self._entries.popitem(last=False)
+                total -= evicted.nbytes
+                logger.info(
+                    f"Evicted exp data of {evicted_name} from cache ({evicted.nbytes} bytes)"
+                )
+
+    def peek(self, exp_name: str, version: Tuple) -> HotExpData | None:
+        """Entry if cached and up to date, without marking it as used"""
+        with self._lock:
+            entry = self._entries.get(exp_name)
+            if entry is None or entry.version != version:
+                return None
+            return entry
+
+    def invalidate(self, exp_name: str | None = None):
+        with self._lock:
+            if exp_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(exp_name, None)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(e.nbytes for e in self._entries.values())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+exp_data_cache = ExpDataCache(exp_data_cache_max_bytes)
+
+
+def get_hot_exp_data(
+    exp_name: str,
+    stored_path: Path,
+    load: Callable[[], enilm.yaml.data.RawData],
+    is_stored: Callable[[], bool],
+) -> HotExpData:
+    entry = exp_data_cache.get(exp_name, ExpDataCache.version(stored_path))
+    if entry is not None and not is_stored():
+        # e.g. the joblib memory of the exp was cleared
+        exp_data_cache.invalidate(exp_name)
+        entry = None
+    if entry is None:
+        data = load()
+        # after loading, the data may have been computed and stored just now
+        entry = HotExpData(
+            overlapping_data=data,
+            nbytes=data_nbytes(data),
+            version=ExpDataCache.version(stored_path),
+        )
+        exp_data_cache.put(exp_name, entry)
+    return entry
+
+
+def peek_hot_exp_data(exp_name: str, stored_path: Path) -> HotExpData | None:
+    """In-memory data of the exp if already loaded (nothing is loaded)"""
+    return exp_data_cache.peek(exp_name, ExpDataCache.version(stored_path))
@@ -0,0 +1,226 @@
+# exported (torchscript / onnx) models for faster cpu inference
+
+import os
+from enum import Enum
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import torch
+import torch.nn as nn
+from dotenv import load_dotenv
+from loguru import logger
+from pydantic import BaseModel, ConfigDict
+
+from . import exps
+from .model import (
+    model_cache,
+    get_model_for_exp,
+    get_weights_hash,
+    get_export_dir,
+    ms_per_batch,
+)
+from .quant import get_quantized_model
+from .utils import tmp_path_for
+
+load_dotenv()
+
+
+class InferenceBackend(str, Enum):
+    EAGER = "eager"
+    TORCHSCRIPT = "torchscript"
+    ONNX = "onnx"
+
+
+# backend used for predictions, exported backends are only used on cpu
+inference_backend = InferenceBackend(os.environ.get("INFERENCE_BACKEND", "eager"))
+
+# max. absolute difference (normalized outputs) between eager and exported model
+export_atol = float(os.environ.get("EXPORT_ATOL", 1e-4))
+
+# number of batches used to measure the speedup when exporting
+export_bench_n_batches = 10
+
+InferenceModel = Callable[[torch.Tensor], torch.Tensor]
+
+
+class ExportReport(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    exp_name: str
+    model_class: str
+    backend: InferenceBackend
+    weights_hash: str
+    max_abs_diff: float
+    atol: float
+    valid: bool  # outputs match eager within atol -> exported model is used
+    eager_ms_per_batch: float
+    exported_ms_per_batch: float
+    speedup: float
+
+
+class OnnxModel:
+    def __init__(self, path: Path):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(
+            str(path), providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        (outputs,) = self.session.run(None, {self.input_name: inputs.numpy()})
+        return torch.from_numpy(outputs)
+
+
+def get_artifact_path(exp_name: str, backend: InferenceBackend) -> Path:
+    suffix = {InferenceBackend.TORCHSCRIPT: "pt", InferenceBackend.ONNX: "onnx"}[
+        backend
+    ]
+    return (
+        get_export_dir(exp_name)
+        / f"{backend.value}-{get_weights_hash(exp_name)}.{suffix}"
+    )
+
+
+def get_report_path(exp_name: str, backend: InferenceBackend) -> Path:
+    return get_artifact_path(exp_name, backend).with_suffix(".json")
+
+
+def export(
+    model: nn.Module, example: torch.Tensor, backend: InferenceBackend, path: Path
+):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if backend is InferenceBackend.TORCHSCRIPT:
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        torch.jit.save(frozen, str(path))
+    elif backend is InferenceBackend.ONNX:
+        torch.onnx.export(
+            model,
+            (example,),
+            str(path),
+            input_names=["mains"],
+            output_names=["pred"],
+            dynamic_axes={"mains": {0: "batch"}, "pred": {0: "batch"}},
+        )
+    else:
+        raise ValueError(f"Cannot export to {backend}")
+
+
+def load_exported(path: Path, backend: InferenceBackend) -> InferenceModel:
+    if backend is InferenceBackend.TORCHSCRIPT:
+        return torch.jit.load(str(path), map_location="cpu")
+    if backend is InferenceBackend.ONNX:
+        return OnnxModel(path)
+    raise ValueError(f"Cannot load {backend}")
+
+
+def export_and_check(exp_name: str, backend: InferenceBackend) -> ExportReport:
+    """Export the exp's model, check its outputs against eager mode and measure the speedup"""
+    exp: exps.ModelExp = exps.get_model_exp_by_name(exp_name)
+    eager = get_model_for_exp(exp_name, torch.device("cpu"))
+    path = get_artifact_path(exp_name, backend)
+
+    # random normalized mains, the last batch is smaller to check the dynamic batch size
+    generator = torch.Generator().manual_seed(0)
+    batches = [
+        torch.randn(exp.batch_size, 1, exp.sequence_length, generator=generator)
+        for _ in range(export_bench_n_batches)
+    ]
+    batches.append(torch.randn(3, 1, exp.sequence_length, generator=generator))
+
+    # written to a temp. file first, moved into place after the report is computed
+    # -> workers never load a partially written artifact
+    logger.info(f"Exporting {exp_name} to {backend.value}")
+    tmp_path = tmp_path_for(path)
+    try:
+        export(eager, batches[0], backend, tmp_path)
+        exported = load_exported(tmp_path, backend)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    with torch.inference_mode():
+        max_abs_diff = max(
+            float(torch.max(torch.abs(eager(batch) - exported(batch))))
+            for batch in batches
+        )
+    eager_ms = ms_per_batch(eager, batches[:-1])
+    exported_ms = ms_per_batch(exported, batches[:-1])
+
+    report = ExportReport(
+        exp_name=exp_name,
+        model_class=exp.model_class,
+        backend=backend,
+        weights_hash=get_weights_hash(exp_name),
+        max_abs_diff=max_abs_diff,
+        atol=export_atol,
+        valid=bool(np.isfinite(max_abs_diff) and max_abs_diff <= export_atol),
+        eager_ms_per_batch=eager_ms,
+        exported_ms_per_batch=exported_ms,
+        speedup=eager_ms / exported_ms,
+    )
+    # the report is written last, a report means its artifact is complete
+    os.replace(tmp_path, path)
+    report_path = get_report_path(exp_name, backend)
+    tmp_report_path = tmp_path_for(report_path)
+    tmp_report_path.write_text(report.model_dump_json())
+    os.replace(tmp_report_path, report_path)
+    if not report.valid:
+        logger.warning(
+            f"Exported {exp_name} ({backend.value}) differs from eager by {max_abs_diff}, using eager"
+        )
+    return report
+
+
+def get_inference_model(
+    exp_name: str,
+    device: torch.device,
+    backend: InferenceBackend = inference_backend,
+    quantized: bool = False,
+) -> InferenceModel:
+    """
+    Model for predictions, exported once per exp (and weights) if an exported backend is selected
+
+    Falls back to the eager model if not on cpu or if the exported outputs do not match eager mode.
+    `quantized` selects the int8 model on cpu (see backend.quant), regardless of the backend.
+    Should be called in `torch.inference_mode()`.
+    """
+    if quantized and device.type == "cpu":
+        return get_quantized_model(exp_name)
+    if backend is InferenceBackend.EAGER or device.type != "cpu":
+        return get_model_for_exp(exp_name, device)
+
+    key = (exp_name, backend.value, get_weights_hash(exp_name))
+    model = model_cache.get(key)
+    if model is not None:
+        return model
+
+    report_path = get_report_path(exp_name, backend)
+    if report_path.exists():
+        report = ExportReport.model_validate_json(report_path.read_text())
+    else:
+        report = export_and_check(exp_name, backend)
+    if not report.valid:
+        return get_model_for_exp(exp_name, device)
+
+    model = load_exported(get_artifact_path(exp_name, backend), backend)
+    model_cache.put(key, model)
+    return model
+
+
+def get_export_reports() -> List[ExportReport]:
+    """Reports of all exported models (e.g. to compare the speedup per model class)"""
+    reports = []
+    for exp in exps.all_exps:
+        if not isinstance(exp, exps.ModelExp):
+            continue
+        export_dir = get_export_dir(exp.exp_name)
+        if not export_dir.exists():
+            continue
+        for report_path in export_dir.glob("*.json"):
+            if report_path.name.startswith("int8-"):
+                continue  # see backend.quant
+            reports.append(ExportReport.model_validate_json(report_path.read_text()))
+    return reports
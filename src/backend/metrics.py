@@ -1,4 +1,20 @@
+import os
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterable, List
+
 import numpy as np
+from dotenv import load_dotenv
+
+from .types.err import ErrType, SplitErrors
+
+load_dotenv()
+
+# errors returned with each prediction (if gt is provided), comma-separated `ErrType` values
+pred_err_types: List[ErrType] = [
+    ErrType(name.strip())
+    for name in os.environ.get("PRED_ERR_TYPES", "MAE,F1").split(",")
+    if name.strip()
+]
 
 
 def mae(gt: np.ndarray, pr: np.ndarray) -> float:
@@ -24,3 +40,124 @@ def f1_score(
         else 2 * (precision * recall) / (precision + recall)
     )
     return f1_score
+
+
+def _ratio(num, den):
+    # 0 where the denominator is 0, for scalars and arrays
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / np.where(den > 0, den, 1), 0.0)
+
+
+def _out(x) -> float | np.ndarray:
+    x = np.asarray(x)
+    return float(x) if x.ndim == 0 else x
+
+
+@dataclass
+class ErrSums:
+    """
+    Sums that all errors of any (union of) ranges can be computed from
+
+    The fields are scalars for one range or arrays (e.g. one per window, see backend.err_index),
+    the metrics are computed the same way for both.
+    """
+
+    n: Any = 0
+    abs_err: Any = 0.0
+    sq_err: Any = 0.0
+    gt: Any = 0.0
+    pr: Any = 0.0
+    gt_sq: Any = 0.0
+    tp: Any = 0
+    fp: Any = 0
+    fn: Any = 0
+
+    @classmethod
+    def of(cls, gt: np.ndarray, pr: np.ndarray, on_power_threshold: float) -> "ErrSums":
+        """All sums in one vectorized pass over gt and pr"""
+        gt_on = gt > on_power_threshold
+        pr_on = pr > on_power_threshold
+        gt64 = gt.astype(np.float64)
+        err = gt64 - pr
+        return cls(
+            n=gt.size,
+            abs_err=float(np.sum(np.abs(err))),
+            sq_err=float(np.sum(np.square(err))),
+            gt=float(np.sum(gt64)),
+            pr=float(np.sum(pr, dtype=np.float64)),
+            gt_sq=float(np.sum(np.square(gt64))),
+            tp=int(np.sum(gt_on & pr_on)),
+            fp=int(np.sum(~gt_on & pr_on)),
+            fn=int(np.sum(gt_on & ~pr_on)),
+        )
+
+    def _map(self, other: "ErrSums", op) -> "ErrSums":
+        return ErrSums(
+            **{
+                name: op(getattr(self, name), getattr(other, name))
+                for name in err_sums_fields
+            }
+        )
+
+    def __add__(self, other: "ErrSums") -> "ErrSums":
+        return self._map(other, lambda a, b: a + b)
+
+    def __sub__(self, other: "ErrSums") -> "ErrSums":
+        return self._map(other, lambda a, b: a - b)
+
+    def mae(self):
+        return _out(_ratio(self.abs_err, self.n))
+
+    def rmse(self):
+        # sums of a prefix-sum difference can be slightly negative
+        return _out(np.sqrt(_ratio(np.maximum(self.sq_err, 0.0), self.n)))
+
+    def sae(self):
+        return _out(_ratio(np.abs(self.pr - self.gt), self.gt))
+
+    def nde(self):
+        return _out(_ratio(np.maximum(self.sq_err, 0.0), self.gt_sq))
+
+    def ea(self):
+        return _out(1 - _ratio(self.abs_err, 2 * self.gt))
+
+    def precision(self):
+        return _out(_ratio(self.tp, self.tp + self.fp))
+
+    def recall(self):
+        return _out(_ratio(self.tp, self.tp + self.fn))
+
+    def f1(self):
+        # same definition as f1_score
+        precision = _ratio(self.tp, self.tp + self.fp)
+        recall = _ratio(self.tp, self.tp + self.fn)
+        return _out(_ratio(2 * (precision * recall), precision + recall))
+
+    def metric(self, err_type: ErrType):
+        return {
+            ErrType.MAE: self.mae,
+            ErrType.RMSE: self.rmse,
+            ErrType.SAE: self.sae,
+            ErrType.NDE: self.nde,
+            ErrType.EA: self.ea,
+            ErrType.PRECISION: self.precision,
+            ErrType.RECALL: self.recall,
+            ErrType.F1: self.f1,
+        }[err_type]()
+
+    def metrics(self, err_types: Iterable[ErrType]) -> Dict[ErrType, Any]:
+        return {err_type: self.metric(err_type) for err_type in err_types}
+
+
+err_sums_fields = [field.name for field in fields(ErrSums)]
+
+
+def split_errors(
+    sums_train: ErrSums, sums_test: ErrSums, err_types: Iterable[ErrType] = ErrType
+) -> SplitErrors:
+    err_types = list(err_types)
+    return SplitErrors(
+        train=sums_train.metrics(err_types),
+        test=sums_test.metrics(err_types),
+        total=(sums_train + sums_test).metrics(err_types),
+    )
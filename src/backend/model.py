@@ -1,13 +1,58 @@
+import os
+import hashlib
 import importlib
+import threading
+import time
+from pathlib import Path
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Tuple
 
 import torch
 import torch.nn as nn
+from dotenv import load_dotenv
+from loguru import logger
 
 from . import exps
 from .mem import get_exp_mem
 
+load_dotenv()
 
-def get_model_for_exp(exp_name: str, device: torch.device) -> nn.Module:
+# max. number of models kept in memory by each process (LRU eviction)
+model_cache_size = int(os.environ.get("MODEL_CACHE_SIZE", 8))
+
+# comma separated model exp names to load when a celery worker process starts
+model_cache_preload = [
+    exp_name.strip()
+    for exp_name in os.environ.get("MODEL_CACHE_PRELOAD", "").split(",")
+    if exp_name.strip() != ""
+]
+
+
+def get_weights_path(exp_name: str) -> Path:
+    exp: exps.ModelExp = exps.get_model_exp_by_name(exp_name)
+    return get_exp_mem(exp_name).models_cache_path / exp.selected_model_weights
+
+
+def get_export_dir(exp_name: str) -> Path:
+    # exported and quantized models with their reports (see backend.export and backend.quant)
+    return get_exp_mem(exp_name).models_cache_path / "export"
+
+
+# (path, mtime, size) -> sha256 of the weights file
+_weights_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def get_weights_hash(exp_name: str) -> str:
+    """sha256 of the weights file, only recomputed if the file has changed"""
+    weights_path = get_weights_path(exp_name)
+    stat = weights_path.stat()
+    key = (str(weights_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _weights_hashes:
+        _weights_hashes[key] = hashlib.sha256(weights_path.read_bytes()).hexdigest()
+    return _weights_hashes[key]
+
+
+def load_model_for_exp(exp_name: str, device: torch.device) -> nn.Module:
     exp: exps.ModelExp = exps.get_model_exp_by_name(exp_name)
 
     # get model based on its class
@@ -25,10 +70,80 @@ def get_model_for_exp(exp_name: str, device: torch.device) -> nn.Module:
     model = model.to(device)
 
     # loading model weights
-    full_models_weights_path = (
-        get_exp_mem(exp_name).models_cache_path / exp.selected_model_weights
-    )
-    model.load_state_dict(torch.load(full_models_weights_path))
+    model.load_state_dict(torch.load(get_weights_path(exp_name), map_location=device))
+
+    return model
+
 
+# nn.Module or any other callable model (e.g. exported, see backend.export)
+CachedModel = Callable[[torch.Tensor], torch.Tensor]
+
+
+class ModelCache:
+    """Process-level LRU cache of loaded models"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._models: OrderedDict[Hashable, CachedModel] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> CachedModel | None:
+        with self._lock:
+            if key not in self._models:
+                return None
+            self._models.move_to_end(key)
+            return self._models[key]
+
+    def put(self, key: Hashable, model: CachedModel):
+        with self._lock:
+            self._models[key] = model
+            self._models.move_to_end(key)
+            while len(self._models) > self.max_size:
+                evicted_key, _ = self._models.popitem(last=False)
+                logger.info(f"Evicted model from cache: {evicted_key}")
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+model_cache = ModelCache(model_cache_size)
+
+
+def get_model_for_exp(exp_name: str, device: torch.device) -> nn.Module:
+    """
+    Cached model for the exp in evaluation mode
+
+    The returned model is shared between callers of the same process, it must not be modified
+    (e.g. registered hooks have to be removed after use).
+    """
+    # weights hash in the key -> re-exported weights are loaded again
+    key = (exp_name, str(device), get_weights_hash(exp_name))
+    model = model_cache.get(key)
+    if model is None:
+        logger.info(f"Loading model for {exp_name} on {device}")
+        model = load_model_for_exp(exp_name, device)
+        model.eval()
+        model_cache.put(key, model)
+    assert isinstance(model, nn.Module)
     return model
 
+
+def preload_models(device: torch.device):
+    for exp_name in model_cache_preload:
+        try:
+            get_model_for_exp(exp_name, device)
+        except Exception as e:
+            logger.warning(f"Could not preload model for {exp_name}: {e}")
+
+
+def ms_per_batch(model: CachedModel, batches: List[torch.Tensor]) -> float:
+    with torch.inference_mode():
+        model(batches[0])  # warm-up
+        start = time.perf_counter()
+        for batch in batches:
+            model(batch)
+    return (time.perf_counter() - start) / len(batches) * 1000
@@ -0,0 +1,107 @@
+# encoding of request/response bodies: json (default), msgpack or arrow ipc stream
+
+import json
+from typing import Any, Type, TypeVar
+
+import msgpack
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+from .types.series import RegularSeries
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    # float32 arrays as raw bytes, timestamps as iso strings
+    if isinstance(obj, np.ndarray):
+        return np.asarray(obj, dtype="<f4").tobytes()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot serialize {type(obj)} to msgpack")
+
+
+def to_msgpack(model: BaseModel) -> bytes:
+    # dict form (RawDataDict) keys are timestamps
+    def keys_to_str(obj: Any) -> Any:
+        if isinstance(obj, dict):
+            return {
+                (k.isoformat() if isinstance(k, pd.Timestamp) else k): keys_to_str(v)
+                for k, v in obj.items()
+            }
+        if isinstance(obj, list):
+            return [keys_to_str(v) for v in obj]
+        return obj
+
+    return msgpack.packb(keys_to_str(model.model_dump()), default=_msgpack_default)
+
+
+def from_msgpack(body: bytes, model_class: Type[Model]) -> Model:
+    return model_class.model_validate(msgpack.unpackb(body))
+
+
+def to_arrow(model: BaseModel) -> bytes:
+    """
+    Each RegularSeries field is a float32 column, all other fields (and the index
+    of the series without their values) are stored as json in the schema metadata
+    """
+    columns = {}
+    fields = {}
+    for name, value in model:
+        if isinstance(value, RegularSeries):
+            columns[name] = pa.array(np.asarray(value.values, dtype=np.float32))
+            fields[name] = json.loads(value.model_dump_json(exclude={"values"}))
+        else:
+            fields[name] = json.loads(model.model_dump_json(include={name}))[name]
+    if len(set(len(column) for column in columns.values())) > 1:
+        raise ValueError("All series must have the same length to be encoded as arrow")
+
+    table = pa.table(columns, metadata={"fields": json.dumps(fields)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_arrow(body: bytes, model_class: Type[Model]) -> Model:
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.schema.metadata is not None
+    fields = json.loads(table.schema.metadata[b"fields"])
+    for name in table.column_names:
+        fields[name]["values"] = table.column(name).to_numpy()
+    return model_class.model_validate(fields)
+
+
+async def parse_body(request: Request, model_class: Type[Model]) -> Model:
+    """Parse the request body based on its content type"""
+    body = await request.body()
+    content_type = request.headers.get("content-type", JSON_MEDIA_TYPE)
+    try:
+        if content_type.startswith(MSGPACK_MEDIA_TYPE):
+            return from_msgpack(body, model_class)
+        if content_type.startswith(ARROW_MEDIA_TYPE):
+            return from_arrow(body, model_class)
+        return model_class.model_validate_json(body)
+    except ValidationError as e:
+        # same 422 response as for bodies parsed by fastapi
+        raise RequestValidationError(e.errors())
+
+
+def encode_response(request: Request, model: BaseModel) -> Response:
+    """Encode the response based on the accept header of the request"""
+    accept = request.headers.get("accept", JSON_MEDIA_TYPE)
+    if MSGPACK_MEDIA_TYPE in accept:
+        return Response(to_msgpack(model), media_type=MSGPACK_MEDIA_TYPE)
+    if ARROW_MEDIA_TYPE in accept:
+        return Response(to_arrow(model), media_type=ARROW_MEDIA_TYPE)
+    return Response(model.model_dump_json(), media_type=JSON_MEDIA_TYPE)
@@ -1,20 +1,35 @@
-import hashlib
+import os
 
-import joblib
+import numpy as np
+from celery import group
 from celery.result import AsyncResult
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
 
 import enilm.norm
 import enilm.etypes
 import enilm.models.torch.utils
 import enilm.yaml.data
 
-from .data import get_data
-from .mem import cache_folder, joblib_verbose
+from . import exps
+from .data import get_overlapping_data
 from .types.pred import PredictResponse, PredictParams
-from .tasks.pred import pred as pred_task
+from .types.series import RegularSeries, to_series_data, series_values, series_index
+from .types.tasks.pred import PredChunkTaskParams, PredChunkTaskResult
+from .windows import context_slice, strided_ds_classes
+from .model import get_weights_hash
+from .progress import await_task_result
+from .pred_cache import pred_cache, get_cached_pred
+from .pred_store import FullPred, get_pred_store_path, load_full_pred, store_full_pred
+from .tasks.pred import pred as pred_task, pred_chunk, to_predict_response
 
+load_dotenv()
 
-def pred(
+# number of samples per chunk of full predictions (rounded up to a multiple of the exp's batch size)
+full_pred_chunk_size = int(os.environ.get("FULL_PRED_CHUNK_SIZE", 262144))
+
+
+async def pred(
     pred_params: PredictParams,
     sync: bool = True,
     no_cache: bool = False,
@@ -22,24 +37,21 @@ def pred(
     # to json for the task
     pred_params_json = pred_params.model_dump_json()
 
-    # memory with hashed pred_params
-    pred_params_hash = hashlib.sha256(pred_params_json.encode()).hexdigest()
-    memory: joblib.Memory = joblib.Memory(
-        cache_folder / "pred" / pred_params_hash, verbose=joblib_verbose
-    )
-
-    def _pred(pred_params_json: str) -> PredictResponse:
+    async def _pred(pred_params_json: str) -> PredictResponse:
         task = pred_task.delay(pred_params_json)
-        res_json = task.get()
+        res_json = await await_task_result(task)
         return PredictResponse.model_validate_json(res_json)
 
     if sync:
         if no_cache:
-            return _pred(pred_params_json)
-        if not no_cache:
-            res = memory.cache(_pred)(pred_params_json)
-            assert isinstance(res, PredictResponse)
-            return res
+            return await _pred(pred_params_json)
+        # see backend.pred_cache
+        # hashing the data and the index and files in the threadpool, not in the event loop
+        key, res = await run_in_threadpool(get_cached_pred, pred_params)
+        if res is None:
+            res = await _pred(pred_params_json)
+            await run_in_threadpool(pred_cache.put, key, res)
+        return res
 
     if not sync:  # async -> cache is not used
         task = pred_task.delay(pred_params_json)
@@ -48,32 +60,90 @@ def pred(
     raise ValueError("Invalid sync value")
 
 
+def chunked_pred(pred_params: PredictParams) -> PredictResponse:
+    """
+    Same result as the pred task, with the series split into chunks predicted in parallel by the celery workers
+
+    Each chunk includes the mains context of its first and last windows. Chunks start at
+    multiples of the batch size, the model sees exactly the batches of the pred task.
+    Falls back to a single pred task for ds_classes without strided windows or irregular data.
+    """
+    exp: exps.ModelExp = exps.get_model_exp_by_name(pred_params.model_exp_name)
+    if exp.ds_class not in strided_ds_classes or not isinstance(
+        pred_params.data, RegularSeries
+    ):
+        res_json = pred_task.delay(pred_params.model_dump_json()).get()
+        return PredictResponse.model_validate_json(res_json)
+
+    mains = pred_params.data.values
+    n = len(mains)
+    chunk_size = int(np.ceil(full_pred_chunk_size / exp.batch_size)) * exp.batch_size
+    chunk_tasks = []
+    for start in range(0, n, chunk_size):
+        slice_start, slice_stop, pad = context_slice(
+            start, min(n, start + chunk_size), n, exp.sequence_length
+        )
+        chunk_params = PredChunkTaskParams(
+            model_exp_name=pred_params.model_exp_name,
+            mains=mains[slice_start:slice_stop],
+            pad=pad,
+        )
+        chunk_tasks.append(pred_chunk.s(chunk_params.model_dump_json()))
+
+    # results are in the order of the chunks
+    chunk_results = group(chunk_tasks).apply_async().get()
+    preds = np.concatenate(
+        [
+            PredChunkTaskResult.model_validate_json(res_json).pred
+            for res_json in chunk_results
+        ]
+    )
+    preds_flat_denorm: np.ndarray = np.array(
+        enilm.norm.denormalize(preds, exp.app_norm_params)
+    )
+    return to_predict_response(pred_params, exp, preds_flat_denorm)
+
+
 def full_pred(
     data_exp_name: str,
     app_name: enilm.etypes.AppName,
     model_exp_name: str | None = None,
-) -> PredictResponse:
+    data: enilm.yaml.data.RawData | None = None,
+) -> FullPred:
+    """
+    Predictions for all the original mains data
+
+    Stored as a memory-mapped float32 array keyed by the data exp, model exp and model weights.
+    `data` is the overlapping data of the data exp if already loaded by the caller.
+    Blocking (waits for the prediction tasks), use `run_in_threadpool` in async handlers.
+    """
     # if model_exp_name is not provided, use data_exp_name
     if model_exp_name is None:
         model_exp_name = data_exp_name
 
-    memory: joblib.Memory = joblib.Memory(
-        cache_folder / "full_pred" / data_exp_name / model_exp_name, verbose=1
+    store_path = get_pred_store_path(
+        data_exp_name, model_exp_name, get_weights_hash(model_exp_name)
+    )
+    stored = load_full_pred(store_path)
+    if stored is not None:
+        return stored
+
+    if data is None:
+        data = get_overlapping_data(data_exp_name)
+
+    # compact form for regular series (smaller celery message, no per-timestamp dicts)
+    predict_params_all: PredictParams = PredictParams(
+        data=to_series_data(data["mains"]),
+        app_name=app_name,
+        gt=to_series_data(data[app_name]),
+        model_exp_name=model_exp_name,
+        quantized=False,  # stored full predictions are the fp32 reference
     )
 
-    @memory.cache
-    def full_pred_cached(data_exp_name: str, model_exp_name: str) -> PredictResponse:
-        """Generate predictions for all the original mains data"""
-        data = get_data(data_exp_name).overlapping_data
-        predict_params_all: PredictParams = PredictParams(
-            data=data["mains"].to_dict(),
-            app_name=app_name,
-            gt=data[app_name].to_dict(),
-            model_exp_name=model_exp_name,
-        )
-
-        pred_res = pred(predict_params_all)
-        assert isinstance(pred_res, PredictResponse)
-        return pred_res
-
-    return full_pred_cached(data_exp_name, model_exp_name)
+    pred_res = chunked_pred(predict_params_all)
+    return store_full_pred(
+        store_path,
+        values=series_values(pred_res.pred),
+        index=series_index(pred_res.pred),
+        errors=pred_res.errors,
+    )
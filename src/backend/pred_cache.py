@@ -0,0 +1,196 @@
+# size-bounded cache of prediction responses keyed by a fingerprint of the request
+
+import os
+import time
+import sqlite3
+import threading
+import hashlib
+from pathlib import Path
+from typing import Tuple
+from contextlib import closing
+
+import numpy as np
+from dotenv import load_dotenv
+from loguru import logger
+from pydantic import BaseModel
+
+from .mem import cache_folder
+from .metrics import pred_err_types
+from .model import get_weights_hash
+from .quant import use_quantized
+from .types.pred import PredictParams, PredictResponse
+from .types.series import RegularSeries, series_values, series_index
+
+try:
+    import xxhash
+except ImportError:  # blake2b is slower but always available
+    xxhash = None
+
+load_dotenv()
+
+pred_cache_path = cache_folder / "pred_cache"
+
+# max. size of the cached responses on disk, least recently used entries are evicted
+pred_cache_max_bytes = int(os.environ.get("PRED_CACHE_MAX_BYTES", 2 * 1024**3))
+
+
+class PredCacheStats(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+    n_entries: int
+    size_bytes: int
+    max_bytes: int
+
+
+def _hasher():
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def _update_series(h, data) -> None:
+    # the form (compact or dict) is part of the key, responses have the same form as the input
+    if isinstance(data, RegularSeries):
+        h.update(b"regular")
+        h.update(
+            f"{data.start.isoformat()}|{data.freq}|{data.tz}|{len(data.values)}".encode()
+        )
+    else:
+        index = series_index(data)
+        h.update(b"dict")
+        h.update(str(index.tz).encode())
+        h.update(np.ascontiguousarray(index.asi8).tobytes())
+    h.update(np.ascontiguousarray(series_values(data), dtype="<f4").tobytes())
+
+
+def pred_fingerprint(params: PredictParams) -> str:
+    """Hash of the float32 data (and gt), their index, the model exp and its weights"""
+    h = _hasher()
+    quantized = use_quantized(params.model_exp_name, params.quantized)
+    h.update(
+        f"{params.model_exp_name}|{get_weights_hash(params.model_exp_name)}|{quantized}|{params.app_name}".encode()
+    )
+    # the returned errors are configurable
+    h.update(",".join(err_type.value for err_type in pred_err_types).encode())
+    _update_series(h, params.data)
+    if params.gt is not None:
+        h.update(b"gt")
+        _update_series(h, params.gt)
+    return h.hexdigest()
+
+
+class PredCache:
+    """
+    Responses stored as json files, indexed in sqlite (shared by all processes)
+
+    The index keeps the size and last access of each entry and the hit/miss counters.
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.path.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+            )
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            con.execute(
+                "INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path / "index.sqlite", timeout=30)
+        con.execute("PRAGMA journal_mode=WAL")
+        return con
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> PredictResponse | None:
+        entry_path = self._entry_path(key)
+        with closing(self._connect()) as con, con:
+            found = (
+                con.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+                is not None
+                and entry_path.exists()
+            )
+            con.execute(
+                "UPDATE counters SET value = value + 1 WHERE name = ?",
+                ("hits" if found else "misses",),
+            )
+            if found:
+                con.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+        if not found:
+            return None
+        try:
+            return PredictResponse.model_validate_json(entry_path.read_bytes())
+        except FileNotFoundError:  # evicted by another process in the meantime
+            return None
+
+    def put(self, key: str, res: PredictResponse):
+        data = res.model_dump_json().encode()
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        # unique per process and thread (puts run in the threadpool of the api)
+        tmp_path = entry_path.with_suffix(f".{os.getpid()}-{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(entry_path)
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+            self._evict(con)
+
+    def _evict(self, con: sqlite3.Connection):
+        (total,) = con.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in con.execute(
+            "SELECT key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            con.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._entry_path(key).unlink(missing_ok=True)
+            total -= size
+            logger.info(f"Evicted prediction {key} from cache ({size} bytes)")
+
+    def stats(self) -> PredCacheStats:
+        with closing(self._connect()) as con:
+            counters = dict(con.execute("SELECT name, value FROM counters").fetchall())
+            n_entries, size = con.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return PredCacheStats(
+            hits=hits,
+            misses=misses,
+            hit_rate=hits / (hits + misses) if hits + misses > 0 else 0.0,
+            n_entries=n_entries,
+            size_bytes=size,
+            max_bytes=self.max_bytes,
+        )
+
+
+pred_cache = PredCache(pred_cache_path, pred_cache_max_bytes)
+
+
+def get_cached_pred(params: PredictParams) -> Tuple[str, PredictResponse | None]:
+    """
+    Fingerprint of the params and their cached response (None if not cached)
+
+    Blocking (hashes the whole data, reads the cache), use `run_in_threadpool` in async handlers.
+    """
+    key = pred_fingerprint(params)
+    return key, pred_cache.get(key)
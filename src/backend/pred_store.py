@@ -0,0 +1,123 @@
+# full predictions as memory-mapped float32 arrays (see backend.pred.full_pred)
+
+import os
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from .mem import cache_folder
+from .types import PDTimestamp
+from .types.pred import PredictionError
+from .types.series import regular_freq
+
+pred_store_path = cache_folder / "full_pred_npy"
+
+
+class TimeIndex(BaseModel):
+    """Descriptor of the time index of a stored array"""
+
+    n: int
+    # regular index: start + i * freq
+    start: PDTimestamp | None = None
+    freq: str | None = None
+    tz: str | None = None
+    # irregular index: int64 ns since epoch (utc) in index.npy next to the descriptor
+    irregular: bool = False
+
+    def local_start(self) -> pd.Timestamp:
+        """Start in the named tz (stored with its utc offset only)"""
+        assert self.start is not None
+        start = pd.Timestamp(self.start)
+        if self.tz is None:
+            return start
+        if start.tzinfo is None:
+            return start.tz_localize(self.tz)
+        return start.tz_convert(self.tz)
+
+
+class StoredPredMeta(BaseModel):
+    index: TimeIndex
+    errors: List[PredictionError] | None = None
+
+
+@dataclass
+class FullPred:
+    values: np.ndarray  # float32, memory-mapped (read-only)
+    meta: StoredPredMeta
+    path: Path
+
+    def index(self) -> pd.DatetimeIndex:
+        index = self.meta.index
+        if index.irregular:
+            utc = pd.to_datetime(np.load(self.path / "index.npy"), utc=True)
+            return (
+                utc.tz_convert(index.tz)
+                if index.tz is not None
+                else utc.tz_localize(None)
+            )
+        assert index.freq is not None
+        return pd.date_range(index.local_start(), periods=index.n, freq=index.freq)
+
+    def to_series(self) -> pd.Series:
+        return pd.Series(self.values, index=self.index())
+
+
+def get_pred_store_path(
+    data_exp_name: str, model_exp_name: str, weights_hash: str
+) -> Path:
+    return pred_store_path / data_exp_name / model_exp_name / weights_hash
+
+
+def load_full_pred(path: Path) -> FullPred | None:
+    """None if not stored"""
+    meta_path = path / "meta.json"
+    if not meta_path.exists():
+        return None
+    return FullPred(
+        values=np.load(path / "pred.npy", mmap_mode="r"),
+        meta=StoredPredMeta.model_validate_json(meta_path.read_text()),
+        path=path,
+    )
+
+
+def store_full_pred(
+    path: Path,
+    values: np.ndarray,
+    index: pd.DatetimeIndex,
+    errors: List[PredictionError] | None = None,
+) -> FullPred:
+    assert len(values) == len(index)
+
+    freq = regular_freq(index)
+    tz = str(index.tz) if index.tz is not None else None
+    if freq is not None:
+        time_index = TimeIndex(n=len(index), start=index[0], freq=freq, tz=tz)
+    else:
+        time_index = TimeIndex(n=len(index), tz=tz, irregular=True)
+
+    # written to a temp. dir first -> readers never see a partially written prediction
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    np.save(tmp_path / "pred.npy", np.asarray(values, dtype=np.float32))
+    if time_index.irregular:
+        utc = index.tz_convert("UTC") if index.tz is not None else index
+        np.save(tmp_path / "index.npy", utc.as_unit("ns").asi8)
+    (tmp_path / "meta.json").write_text(
+        StoredPredMeta(index=time_index, errors=errors).model_dump_json()
+    )
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # stored concurrently by another process
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    full_pred = load_full_pred(path)
+    assert full_pred is not None
+    return full_pred
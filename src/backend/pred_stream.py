@@ -0,0 +1,139 @@
+# streamed predictions: the pred_stream task pushes chunks to a redis list, the api relays them one by one
+
+import os
+import json
+from typing import AsyncIterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from celery.result import AsyncResult
+from dotenv import load_dotenv
+from pydantic import TypeAdapter
+
+from .redis import redis_client, async_redis_client
+from .types.series import RegularSeries
+from .types.tasks import CeleryTaskId
+from .types.tasks.pred import (
+    PredStreamItem,
+    PredStreamChunk,
+    PredStreamEnd,
+    PredStreamError,
+)
+
+load_dotenv()
+
+# min. number of predictions per streamed chunk (whole batches are streamed)
+pred_stream_chunk_size = int(os.environ.get("PRED_STREAM_CHUNK_SIZE", 65536))
+
+# seconds the chunks are kept if not consumed (e.g. the client disconnected)
+pred_stream_expire = 3600
+
+# seconds to wait for the next chunk before checking whether the task has died
+pred_stream_poll_interval = 15
+
+pred_stream_item_adapter: TypeAdapter[PredStreamItem] = TypeAdapter(PredStreamItem)
+
+
+def pred_stream_key(task_id: CeleryTaskId) -> str:
+    return f"pred_stream:{task_id}"
+
+
+def push_stream_item(
+    task_id: CeleryTaskId, item: PredStreamChunk | PredStreamEnd | PredStreamError
+):
+    key = pred_stream_key(task_id)
+    redis_client.rpush(key, item.model_dump_json())
+    redis_client.expire(key, pred_stream_expire)
+
+
+async def iter_stream_items(task_id: CeleryTaskId) -> AsyncIterator[str]:
+    """Json items of the stream in order, until (and including) the end or error item"""
+    key = pred_stream_key(task_id)
+    try:
+        while True:
+            popped = await async_redis_client.blpop([key], pred_stream_poll_interval)
+            if popped is None:
+                task = AsyncResult(task_id)
+                if task.ready():
+                    # the task finished without an end item, e.g. killed
+                    yield PredStreamError(msg=str(task.result)).model_dump_json()
+                    return
+                continue
+            _, item_json = popped
+            yield item_json
+            if json.loads(item_json)["type"] != "chunk":
+                return
+    finally:
+        await async_redis_client.delete(key)
+
+
+async def ndjson_stream(task_id: CeleryTaskId) -> AsyncIterator[str]:
+    async for item_json in iter_stream_items(task_id):
+        yield item_json + "\n"
+
+
+def chunk_record_batch(chunk: PredStreamChunk) -> pa.RecordBatch:
+    if isinstance(chunk.pred, RegularSeries):
+        return pa.record_batch(
+            {"pred": pa.array(np.asarray(chunk.pred.values, dtype=np.float32))}
+        )
+    return pa.record_batch(
+        {
+            "timestamp": pa.array(pd.DatetimeIndex(list(chunk.pred.keys()))),
+            "pred": pa.array(np.array(list(chunk.pred.values()), dtype=np.float32)),
+        }
+    )
+
+
+class _BytesSink:
+    """Write target of the arrow stream writer, the written bytes are taken after each batch"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+async def arrow_stream(task_id: CeleryTaskId) -> AsyncIterator[bytes]:
+    """
+    Arrow ipc stream with one record batch per chunk
+
+    The index of compact series (without values) is stored as json in the schema metadata
+    (`pred`), series in dict form have a timestamp column. Errors are only part of the ndjson stream.
+    """
+    sink = _BytesSink()
+    writer: pa.RecordBatchStreamWriter | None = None
+    async for item_json in iter_stream_items(task_id):
+        item = pred_stream_item_adapter.validate_json(item_json)
+        if isinstance(item, PredStreamError):
+            raise RuntimeError(item.msg)
+        if isinstance(item, PredStreamEnd):
+            break
+        batch = chunk_record_batch(item)
+        if writer is None:
+            metadata = {}
+            if isinstance(item.pred, RegularSeries):
+                metadata["pred"] = item.pred.model_dump_json(exclude={"values"})
+            writer = pa.ipc.new_stream(
+                pa.PythonFile(sink, mode="w"), batch.schema.with_metadata(metadata)
+            )
+        writer.write_batch(batch)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from typing import Any, AsyncIterator, Type
+
+from celery import Task, states
+from celery.result import AsyncResult
+from dotenv import load_dotenv
+from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+
+from .redis import redis_client, async_redis_client
+from .types.tasks import CeleryTaskId, TaskState
+
+load_dotenv()
+
+# seconds after which the progress is written again even if the percentage did not change
+progress_heartbeat_interval = float(os.environ.get("PROGRESS_HEARTBEAT_INTERVAL", 5))
+
+# seconds between keep-alive comments of the event stream
+events_keepalive_interval = 15.0
+
+# seconds between checks of the result while awaiting a task (in case its final event was missed)
+await_result_poll_interval = 5.0
+
+
+def progress_channel(task_id: CeleryTaskId) -> str:
+    return f"task_progress:{task_id}"
+
+
+def publish_task_event(
+    task_id: CeleryTaskId, state: TaskState, msg: dict | None = None
+):
+    redis_client.publish(
+        progress_channel(task_id),
+        json.dumps({"state": state.value, "msg": msg}),
+    )
+
+
+class ProgressReporter:
+    """
+    Throttled progress of a celery task
+
+    A progress message is written to the result backend (`update_state`) and published
+    to the task's channel only when its percentage changes or after `heartbeat_interval`
+    seconds without a write. Without a task (e.g. called directly) nothing is written.
+    """
+
+    def __init__(
+        self,
+        task: Task | None,
+        msg_class: Type[BaseModel],
+        heartbeat_interval: float = progress_heartbeat_interval,
+    ):
+        self.task = task
+        self.msg_class = msg_class
+        self.heartbeat_interval = heartbeat_interval
+        self.percentage: int | None = None
+        self.last_write: float = 0.0
+
+    def _write(self, state: TaskState, percentage: int):
+        self.percentage = percentage
+        self.last_write = time.monotonic()
+        if not self.task or self.task.request.id is None:
+            return
+        msg = self.msg_class(percentage=percentage)
+        self.task.update_state(state=state, meta=msg.model_dump_json())
+        publish_task_event(self.task.request.id, state, msg.model_dump())
+
+    def start(self):
+        self._write(TaskState.STARTED, 0)
+
+    def update(self, done: float, total: float):
+        percentage = min(int(done / total * 100), 100) if total > 0 else 100
+        if (
+            percentage != self.percentage
+            or time.monotonic() - self.last_write >= self.heartbeat_interval
+        ):
+            self._write(TaskState.RUNNING, percentage)
+
+    def finish(self):
+        self._write(TaskState.FINISHED, 100)
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def result_event(task: AsyncResult) -> str:
+    # blocking (reads the result backend), use `run_in_threadpool` in async code
+    if task.successful():
+        return sse_event("result", task.result)
+    return sse_event(
+        "error", json.dumps({"state": TaskState.FAILED.value, "msg": str(task.result)})
+    )
+
+
+async def task_events(task_id: CeleryTaskId) -> AsyncIterator[str]:
+    """
+    Server-sent events of a task: `progress` events followed by one `result` (or `error`) event
+
+    The result event carries the task's return value (JSON) as data. The result backend
+    is read with the async client or in the threadpool, not in the event loop.
+    """
+    pubsub = async_redis_client.pubsub()
+    await pubsub.subscribe(progress_channel(task_id))
+    try:
+        # the task may have progressed or finished before subscribing
+        task = AsyncResult(task_id)
+        if await _task_ready(task):
+            yield await run_in_threadpool(result_event, task)
+            return
+        state, info = await run_in_threadpool(lambda: (task.state, task.info))
+        if isinstance(info, str):
+            yield sse_event(
+                "progress",
+                json.dumps({"state": state, "msg": json.loads(info)}),
+            )
+
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=events_keepalive_interval,
+            )
+            if message is None:
+                # no event for a while, the final event may have been missed
+                if await _task_ready(task):
+                    yield await run_in_threadpool(result_event, task)
+                    return
+                yield ": keep-alive\n\n"
+                continue
+
+            event = json.loads(message["data"])
+            if event["state"] in (TaskState.SUCCESS.value, TaskState.FAILED.value):
+                yield await run_in_threadpool(result_event, task)
+                return
+            yield sse_event("progress", message["data"])
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+async def _task_ready(task: AsyncResult) -> bool:
+    # the stored result (celery's redis backend) read with the async client
+    meta_json = await async_redis_client.get(
+        task.backend.get_key_for_task(task.id).decode()
+    )
+    if meta_json is None:
+        return False
+    return json.loads(meta_json)["status"] in states.READY_STATES
+
+
+async def await_task_result(task: AsyncResult) -> Any:
+    """
+    Result of the task (as `task.get()`) without blocking the event loop
+
+    Woken up by the events of the task's progress channel, the result is checked again
+    every `await_result_poll_interval` seconds.
+    """
+    pubsub = async_redis_client.pubsub()
+    await pubsub.subscribe(progress_channel(task.id))
+    try:
+        while not await _task_ready(task):
+            await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=await_result_poll_interval,
+            )
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+    # ready -> returns without waiting (or raises the task's exception)
+    return await run_in_threadpool(task.get)
@@ -0,0 +1,203 @@
+# int8 dynamic quantized models for cpu inference
+
+import os
+import copy
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import torch
+import torch.nn as nn
+from dotenv import load_dotenv
+from loguru import logger
+from pydantic import BaseModel, ConfigDict
+
+import enilm.norm
+
+from . import apps
+from . import exps
+from . import metrics
+from .data import get_overlapping_data
+from .model import (
+    model_cache,
+    get_model_for_exp,
+    get_weights_hash,
+    get_export_dir,
+    ms_per_batch,
+)
+from .utils import tmp_path_for
+from .windows import iter_batches
+
+load_dotenv()
+
+# comma separated model exp names predicted with the quantized model unless a request chooses otherwise
+quantized_exps = [
+    exp_name.strip()
+    for exp_name in os.environ.get("QUANTIZED_EXPS", "").split(",")
+    if exp_name.strip() != ""
+]
+
+# layer types replaced by dynamic int8 versions (weights int8, activations quantized on the fly)
+quantized_layer_types = {nn.Linear, nn.LSTM, nn.GRU}
+
+
+class QuantReport(BaseModel):
+    """Accuracy of the quantized model on the exp's test split compared to fp32"""
+
+    model_config = ConfigDict(protected_namespaces=())
+    exp_name: str
+    model_class: str
+    weights_hash: str
+    n_quantized_layers: int
+    fp32_mae: float
+    int8_mae: float
+    mae_delta: float  # int8 - fp32 (W)
+    fp32_f1: float
+    int8_f1: float
+    f1_delta: float  # int8 - fp32
+    fp32_ms_per_batch: float
+    int8_ms_per_batch: float
+    speedup: float
+
+
+def use_quantized(exp_name: str, quantized: bool | None = None) -> bool:
+    """Quantized model for the exp if requested, else the exp's default (QUANTIZED_EXPS)"""
+    if quantized is not None:
+        return quantized
+    return exp_name in quantized_exps
+
+
+def get_quant_report_path(exp_name: str) -> Path:
+    return get_export_dir(exp_name) / f"int8-{get_weights_hash(exp_name)}.json"
+
+
+def quantize(model: nn.Module) -> nn.Module:
+    # conv layers are kept in fp32, static quantization would need per model class quant stubs
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model), quantized_layer_types, dtype=torch.qint8
+    )
+
+
+def n_quantized_layers(model: nn.Module) -> int:
+    return sum(
+        1
+        for module in model.modules()
+        if type(module).__module__.startswith("torch.ao.nn.quantized.dynamic")
+    )
+
+
+def build_quant_report(exp_name: str, fp32: nn.Module, int8: nn.Module) -> QuantReport:
+    exp: exps.ModelExp = exps.get_model_exp_by_name(exp_name)
+
+    # test split as in the total error: the samples after the train percentage
+    data = get_overlapping_data(exp_name)
+    app_name = apps.find_matching_app_name_in_data_keys(exp_name, exp.app, data.keys())
+    mains_np = np.array(list(data["mains"]), dtype=np.float32)
+    gt_np = np.array(list(data[app_name]), dtype=np.float32)
+    train_size = int(exp.selected_train_percent * gt_np.size)
+    mains_test = np.array(
+        enilm.norm.normalize(mains_np[train_size:], exp.mains_norm_params)
+    )
+    gt_test = gt_np[train_size:]
+
+    batches = list(iter_batches(exp, mains_test))
+    with torch.inference_mode():
+        fp32_pred = np.concatenate([fp32(b).numpy().flatten() for b in batches])
+        int8_pred = np.concatenate([int8(b).numpy().flatten() for b in batches])
+    fp32_pred = np.array(enilm.norm.denormalize(fp32_pred, exp.app_norm_params))
+    int8_pred = np.array(enilm.norm.denormalize(int8_pred, exp.app_norm_params))
+
+    fp32_mae = metrics.mae(gt_test, fp32_pred)
+    int8_mae = metrics.mae(gt_test, int8_pred)
+    fp32_f1 = metrics.f1_score(gt_test, fp32_pred, exp.on_power_threshold)
+    int8_f1 = metrics.f1_score(gt_test, int8_pred, exp.on_power_threshold)
+
+    # speed on full batches only
+    bench_batches = [b for b in batches if b.size(0) == exp.batch_size][:10] or batches
+    fp32_ms = ms_per_batch(fp32, bench_batches)
+    int8_ms = ms_per_batch(int8, bench_batches)
+
+    return QuantReport(
+        exp_name=exp_name,
+        model_class=exp.model_class,
+        weights_hash=get_weights_hash(exp_name),
+        n_quantized_layers=n_quantized_layers(int8),
+        fp32_mae=fp32_mae,
+        int8_mae=int8_mae,
+        mae_delta=int8_mae - fp32_mae,
+        fp32_f1=fp32_f1,
+        int8_f1=int8_f1,
+        f1_delta=int8_f1 - fp32_f1,
+        fp32_ms_per_batch=fp32_ms,
+        int8_ms_per_batch=int8_ms,
+        speedup=fp32_ms / int8_ms,
+    )
+
+
+def get_quantized_model(exp_name: str) -> nn.Module:
+    """
+    Cached int8 model of the exp (cpu only)
+
+    Its accuracy report is built by the quant_report task, see `store_quant_report`.
+    """
+    key = (exp_name, "int8", get_weights_hash(exp_name))
+    model = model_cache.get(key)
+    if model is not None:
+        assert isinstance(model, nn.Module)
+        return model
+
+    fp32 = get_model_for_exp(exp_name, torch.device("cpu"))
+    start = time.perf_counter()
+    model = quantize(fp32)
+    logger.info(
+        f"Quantized {exp_name} in {time.perf_counter() - start:.2f}s ({n_quantized_layers(model)} layers)"
+    )
+    model_cache.put(key, model)
+    return model
+
+
+def has_quant_report(exp_name: str) -> bool:
+    return get_quant_report_path(exp_name).exists()
+
+
+def store_quant_report(exp_name: str) -> QuantReport:
+    """
+    Accuracy report of the int8 model, built (test split) and stored once per exp and weights
+
+    Slow, run by the quant_report task (see backend.tasks.quant) and not in the request path.
+    """
+    report_path = get_quant_report_path(exp_name)
+    if report_path.exists():
+        return QuantReport.model_validate_json(report_path.read_text())
+
+    fp32 = get_model_for_exp(exp_name, torch.device("cpu"))
+    report = build_quant_report(exp_name, fp32, get_quantized_model(exp_name))
+    tmp_report_path = tmp_path_for(report_path)
+    tmp_report_path.write_text(report.model_dump_json())
+    os.replace(tmp_report_path, report_path)
+    logger.info(
+        f"Quantized {exp_name}: MAE {report.mae_delta:+.3f} W, F1 {report.f1_delta:+.4f}, {report.speedup:.2f}x"
+    )
+    return report
+
+
+def preload_quantized_models():
+    for exp_name in quantized_exps:
+        try:
+            get_quantized_model(exp_name)
+        except Exception as e:
+            logger.warning(f"Could not preload quantized model for {exp_name}: {e}")
+
+
+def get_quant_reports() -> List[QuantReport]:
+    reports = []
+    for exp in exps.all_exps:
+        if not isinstance(exp, exps.ModelExp):
+            continue
+        export_dir = get_export_dir(exp.exp_name)
+        if not export_dir.exists():
+            continue
+        for report_path in export_dir.glob("int8-*.json"):
+            reports.append(QuantReport.model_validate_json(report_path.read_text()))
+    return reports
@@ -0,0 +1,216 @@
+# overlapping data of each exp as memory-mapped float32 columns sharing one time index
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+import enilm.yaml.data
+
+from .mem import cache_folder
+from .config import get_config
+from .data import get_overlapping_data
+from .pred_store import TimeIndex
+from .downsample import DownsampleMode, Pyramid, get_pyramid
+from .types.series import regular_freq
+
+series_store_path = cache_folder / "series_store"
+
+
+@dataclass
+class StoredIndex:
+    """Time index of stored columns, sliced by position without building the whole index"""
+
+    meta: TimeIndex
+    utc_ns: np.ndarray | None = None  # irregular only, memory-mapped
+
+    @classmethod
+    def of(cls, index: pd.DatetimeIndex) -> Tuple[TimeIndex, np.ndarray | None]:
+        """Descriptor of the index and, if irregular, its int64 ns since epoch (utc)"""
+        freq = regular_freq(index)
+        tz = str(index.tz) if index.tz is not None else None
+        if freq is not None:
+            return TimeIndex(n=len(index), start=index[0], freq=freq, tz=tz), None
+        utc = index.tz_convert("UTC") if index.tz is not None else index
+        return TimeIndex(n=len(index), tz=tz, irregular=True), utc.as_unit("ns").asi8
+
+    @classmethod
+    def load(cls, meta: TimeIndex, path: Path) -> "StoredIndex":
+        if meta.irregular:
+            return cls(meta=meta, utc_ns=np.load(path / "index.npy", mmap_mode="r"))
+        return cls(meta=meta)
+
+    def __len__(self) -> int:
+        return self.meta.n
+
+    @property
+    def _start(self) -> pd.Timestamp:
+        return self.meta.local_start()
+
+    @property
+    def _step(self) -> pd.Timedelta:
+        assert self.meta.freq is not None
+        return pd.Timedelta(pd.tseries.frequencies.to_offset(self.meta.freq))
+
+    def range_slice(self, start: pd.Timestamp, end: pd.Timestamp) -> Tuple[int, int]:
+        """Samples [i, j) within the (inclusive) time range"""
+        start_ns, end_ns = pd.Timestamp(start).value, pd.Timestamp(end).value
+        if self.meta.irregular:
+            assert self.utc_ns is not None
+            i = int(np.searchsorted(self.utc_ns, start_ns, "left"))
+            j = int(np.searchsorted(self.utc_ns, end_ns, "right"))
+        else:
+            # regular: the positions follow from the start and the step
+            first_ns, step_ns = self._start.value, self._step.value
+            i = max(0, -((first_ns - start_ns) // step_ns))  # ceil
+            j = min(self.meta.n, (end_ns - first_ns) // step_ns + 1)
+        return i, max(i, j)
+
+    def slice(self, i: int, j: int) -> pd.DatetimeIndex:
+        if self.meta.irregular:
+            assert self.utc_ns is not None
+            utc = pd.to_datetime(np.asarray(self.utc_ns[i:j]), utc=True)
+            return (
+                utc.tz_convert(self.meta.tz)
+                if self.meta.tz is not None
+                else utc.tz_localize(None)
+            )
+        return pd.date_range(
+            self._start + i * self._step, periods=max(0, j - i), freq=self.meta.freq
+        )
+
+    def take(self, positions: np.ndarray) -> pd.DatetimeIndex:
+        """Timestamps of the samples at the (sorted) positions"""
+        if self.meta.irregular:
+            assert self.utc_ns is not None
+            utc = pd.to_datetime(np.asarray(self.utc_ns[positions]), utc=True)
+            return (
+                utc.tz_convert(self.meta.tz)
+                if self.meta.tz is not None
+                else utc.tz_localize(None)
+            )
+        return pd.DatetimeIndex(self._start + positions * self._step)
+
+    def first(self) -> pd.Timestamp:
+        return self.slice(0, 1)[0]
+
+    def last(self) -> pd.Timestamp:
+        return self.slice(self.meta.n - 1, self.meta.n)[0]
+
+
+class SeriesStoreMeta(BaseModel):
+    index: TimeIndex
+    columns: List[str]  # column i is stored in {i}.npy
+
+
+@dataclass
+class SeriesStore:
+    meta: SeriesStoreMeta
+    index: StoredIndex
+    columns: Dict[str, np.ndarray]  # float32, memory-mapped (read-only)
+    path: Path
+    # requested app name -> column (see backend.apps)
+    app_names: Dict[str, str] = field(default_factory=dict)
+
+    def range_slice(self, start: pd.Timestamp, end: pd.Timestamp) -> Tuple[int, int]:
+        return self.index.range_slice(start, end)
+
+    def series(self, name: str, i: int, j: int) -> pd.Series:
+        """Samples [i, j) of a column, the values are not copied"""
+        return pd.Series(self.columns[name][i:j], index=self.index.slice(i, j))
+
+    def pyramid(self, name: str) -> Pyramid:
+        return get_pyramid(
+            self.path / "pyramid" / str(self.meta.columns.index(name)),
+            self.columns[name],
+        )
+
+
+def downsampled_series(
+    pyramid: Pyramid,
+    index: StoredIndex,
+    i: int,
+    j: int,
+    max_points: int | None,
+    mode: DownsampleMode,
+) -> pd.Series:
+    """Samples [i, j), at most max_points of them (see backend.downsample)"""
+    if max_points is None or j - i <= max_points:
+        return pd.Series(pyramid.values[i:j], index=index.slice(i, j))
+    positions, values = pyramid.downsample(i, j, max_points, mode)
+    return pd.Series(values, index=index.take(positions))
+
+
+def load_series_store(path: Path) -> SeriesStore | None:
+    """None if not stored"""
+    meta_path = path / "meta.json"
+    if not meta_path.exists():
+        return None
+    meta = SeriesStoreMeta.model_validate_json(meta_path.read_text())
+    return SeriesStore(
+        meta=meta,
+        index=StoredIndex.load(meta.index, path),
+        columns={
+            name: np.load(path / f"{i}.npy", mmap_mode="r")
+            for i, name in enumerate(meta.columns)
+        },
+        path=path,
+    )
+
+
+def store_series(path: Path, data: enilm.yaml.data.RawData):
+    """All series of the data on the index of the mains"""
+    index = data["mains"].index
+    assert isinstance(index, pd.DatetimeIndex)
+    time_index, utc_ns = StoredIndex.of(index)
+    columns = list(data.keys())
+
+    # written to a temp. dir first, as the full predictions (see backend.pred_store)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    for i, name in enumerate(columns):
+        np.save(
+            tmp_path / f"{i}.npy",
+            data[name].reindex(index).to_numpy(dtype=np.float32),
+        )
+    if utc_ns is not None:
+        np.save(tmp_path / "index.npy", utc_ns)
+    (tmp_path / "meta.json").write_text(
+        SeriesStoreMeta(index=time_index, columns=columns).model_dump_json()
+    )
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+# loaded stores of this process by (exp, hash of the exp's data config)
+_series_stores: Dict[Tuple[str, str], SeriesStore] = {}
+
+
+def get_series_store(exp_name: str) -> SeriesStore:
+    """
+    Stored overlapping data of the exp, written once per data config
+
+    Blocking (loads the data on the first call), use `run_in_threadpool` in async handlers.
+    """
+    config_hash = joblib.hash(get_config(exp_name))
+    key = (exp_name, config_hash)
+    if key in _series_stores:
+        return _series_stores[key]
+
+    path = series_store_path / exp_name / config_hash
+    store = load_series_store(path)
+    if store is None:
+        store_series(path, get_overlapping_data(exp_name))
+        store = load_series_store(path)
+        assert store is not None
+    _series_stores[key] = store
+    return store
@@ -1,6 +1,12 @@
 from celery.app import Celery
+from celery.signals import worker_process_init, task_success, task_failure
 
 from ..redis import redis_url
+from ..utils import get_device
+from ..model import preload_models
+from ..quant import preload_quantized_models
+from ..progress import publish_task_event
+from ..types.tasks import TaskState
 
 app: Celery = Celery(
     __name__, 
@@ -10,6 +16,7 @@ app: Celery = Celery(
         'backend.tasks.dummy',
         'backend.tasks.pred',
         'backend.tasks.err',
+        'backend.tasks.quant',
     ]
 )
 
@@ -17,5 +24,28 @@ app.conf.update(
     result_expires=3600,  # 1 hour
 )
 
+
+@worker_process_init.connect
+def on_worker_process_init(**kwargs):
+    # avoid paying the cold-load cost on the first prediction after a (re)start
+    device = get_device()
+    preload_models(device)
+    if device.type == "cpu":
+        preload_quantized_models()
+
+
+# sent after the result is stored -> subscribers of the progress channel can fetch it
+@task_success.connect
+def on_task_success(sender=None, **kwargs):
+    if sender is not None and sender.request.id is not None:
+        publish_task_event(sender.request.id, TaskState.SUCCESS)
+
+
+@task_failure.connect
+def on_task_failure(task_id=None, **kwargs):
+    if task_id is not None:
+        publish_task_event(task_id, TaskState.FAILED)
+
+
 if __name__ == "__main__":
     app.start()
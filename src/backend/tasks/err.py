@@ -1,65 +1,106 @@
-from typing import List
-
 import numpy as np
 
-from .. import apps
-from .. import metrics
 from .celery import app
-from ..data import get_data
-from ..types.tasks import TaskState
+from ..data import get_overlapping_data
+from ..err_index import open_err_index
+from ..progress import ProgressReporter
+from ..pred_store import load_full_pred
 from ..types.err import ErrType
 from ..types.tasks.err import (
     ComputeErrTaskParams,
     ComputeErrTaskResult,
     ComputeErrProgressMsg,
+    CompareTaskParams,
+    CompareTaskResult,
+    ModelErrors,
 )
 
 
 @app.task(name="compute_errors", bind=True)
 def compute_errors(self, params_json: str) -> str:
-    if self:
-        self.update_state(
-            state=TaskState.STARTED,
-            meta=ComputeErrProgressMsg(percentage=0).model_dump_json(),
-        )
+    progress = ProgressReporter(self, ComputeErrProgressMsg)
+    progress.start()
     p: ComputeErrTaskParams = ComputeErrTaskParams.model_validate_json(params_json)
 
-    data = get_data(p.exp_name).overlapping_data
-    matched_app_name = apps.find_matching_app_name_in_data_keys(
-        p.exp_name,
-        p.app_name,
-        data.keys(),
+    full_pred = load_full_pred(p.full_pred_path)
+    if full_pred is None:
+        raise FileNotFoundError(f"No stored full prediction in {p.full_pred_path}")
+
+    # the stored error index of the prediction, the gt is only loaded to build it
+    def load_gt() -> np.ndarray:
+        data = get_overlapping_data(p.exp_name)
+        return data[p.app_name].to_numpy(dtype=np.float32)
+
+    err_index = open_err_index(full_pred, p.app_name, p.on_power_threshold, load_gt)
+
+    # windows starting at 0 to n - seq_len - 1
+    n_windows = max(0, len(err_index) - p.seq_len)
+
+    err_types = [p.err_type]
+    if p.err_type is ErrType.F1:
+        err_types += [ErrType.PRECISION, ErrType.RECALL]
+    window_errors = err_index.window_errors(
+        0, n_windows + p.seq_len - 1, p.seq_len, err_types
     )
-    gt_np = np.array(list(data[matched_app_name]), dtype=np.float32)
-    pr_np = np.array(list(p.full_pred.pred.values()), dtype=np.float32)
-
-    errors: List[float] = []
-    for wind_start in range(0, gt_np.size - p.seq_len):
-        gt_np_wind = gt_np[wind_start : wind_start + p.seq_len]
-        pr_np_wind = pr_np[wind_start : wind_start + p.seq_len]
-
-        if p.err_type is ErrType.MAE:
-            errors.append(metrics.mae(gt_np_wind, pr_np_wind))
-        elif p.err_type is ErrType.F1:
-            errors.append(
-                metrics.f1_score(gt_np_wind, pr_np_wind, p.on_power_threshold)
-            )
+    errors = window_errors[p.err_type]
+    precision = window_errors.get(ErrType.PRECISION)
+    recall = window_errors.get(ErrType.RECALL)
 
-        if self:
-            progress_percentage = int(wind_start / (gt_np.size - p.seq_len) * 100)
-            if progress_percentage > 100:
-                progress_percentage = 100
-            self.update_state(
-                state=TaskState.RUNNING,
-                meta=ComputeErrProgressMsg(
-                    percentage=progress_percentage
-                ).model_dump_json(),
-            )
+    progress.finish()
+
+    return ComputeErrTaskResult(
+        errors=errors, precision=precision, recall=recall
+    ).model_dump_json()
 
-    if self:
-        self.update_state(
-            state=TaskState.FINISHED,
-            meta=ComputeErrProgressMsg(percentage=100).model_dump_json(),
+
+@app.task(name="compare_models", bind=True)
+def compare_models(self, params_json: str) -> str:
+    """
+    Errors of the stored full predictions of several model exps for the same data
+
+    The gt is loaded at most once, and only if the error index of a prediction is not stored yet.
+    """
+    progress = ProgressReporter(self, ComputeErrProgressMsg)
+    progress.start()
+    p: CompareTaskParams = CompareTaskParams.model_validate_json(params_json)
+
+    gt_np: np.ndarray | None = None
+
+    def load_gt() -> np.ndarray:
+        nonlocal gt_np
+        if gt_np is None:
+            data = get_overlapping_data(p.data_exp_name)
+            gt_np = data[p.app_name].to_numpy(dtype=np.float32)
+        return gt_np
+
+    n_samples = 0
+    models = []
+    for i, model in enumerate(p.models):
+        full_pred = load_full_pred(model.full_pred_path)
+        if full_pred is None:
+            raise FileNotFoundError(
+                f"No stored full prediction in {model.full_pred_path}"
+            )
+        err_index = open_err_index(
+            full_pred, p.app_name, model.on_power_threshold, load_gt
+        )
+        n_samples = len(err_index)
+        train_size = int(model.selected_train_percent * n_samples)
+        models.append(
+            ModelErrors(
+                model_exp_name=model.model_exp_name,
+                errors=err_index.split_errors(train_size, p.err_types),
+                window_errors=(
+                    err_index.window_errors(0, n_samples, p.window, p.err_types)
+                    if p.window is not None
+                    else None
+                ),
+            )
         )
+        progress.update(i + 1, len(p.models))
+
+    progress.finish()
 
-    return ComputeErrTaskResult(errors=errors).model_dump_json()
+    return CompareTaskResult(
+        n_samples=n_samples, window=p.window, models=models
+    ).model_dump_json()
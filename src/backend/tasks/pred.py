@@ -1,28 +1,66 @@
-import importlib
+from typing import Iterator, List
 
 import numpy as np
 import torch
-import torch.nn as nn
-from torch.utils.data import DataLoader
 import enilm.norm
 
 from .celery import app
 from .. import metrics
 from .. import exps
 from ..utils import get_device
-from ..model import get_model_for_exp
+from ..export import get_inference_model, InferenceModel
+from ..quant import use_quantized
+from .quant import enqueue_quant_report
+from ..windows import iter_batches, n_batches, padded_windows
+from ..progress import ProgressReporter
+from ..pred_stream import push_stream_item, pred_stream_chunk_size
 from ..types import RawDataDict
-from ..types.tasks import TaskState
+from ..types.series import RegularSeries, series_values
+from ..types.err import err_units
 from ..types.pred import PredictParams, PredictResponse, PredictionError
-from ..types.tasks.pred import PredProgressMsg
+from ..types.tasks.pred import (
+    PredProgressMsg,
+    PredChunkTaskParams,
+    PredChunkTaskResult,
+    PredStreamChunk,
+    PredStreamEnd,
+    PredStreamError,
+)
+
+
+def iter_pred_batches(
+    predict_params: PredictParams,
+    exp: exps.ModelExp,
+    progress: ProgressReporter,
+) -> Iterator[np.ndarray]:
+    """Model outputs (normalized) batch by batch"""
+    device: torch.device = get_device()
+    quantized = use_quantized(predict_params.model_exp_name, predict_params.quantized)
+    # cached model, already in evaluation mode i.e. disabling dropout and using population statistics for batch normalization
+    # (exported if INFERENCE_BACKEND is set, see backend.export)
+    model: InferenceModel = get_inference_model(
+        predict_params.model_exp_name, device, quantized=quantized
+    )
+    if quantized and device.type == "cpu":
+        # built by its own task, not while predicting
+        enqueue_quant_report(predict_params.model_exp_name)
 
+    # convert data to expected format
+    data_np: np.ndarray = series_values(predict_params.data)
 
-def get_exp_ds_class(exp: exps.ModelExp):
-    ds_class_path = ".".join(exp.ds_class.split(".")[:-1])
-    ds_class_name = exp.ds_class.split(".")[-1]
-    module = importlib.import_module(ds_class_path)
-    clazz = getattr(module, ds_class_name)
-    return clazz
+    # normalize data
+    data_normalized = np.array(enilm.norm.normalize(data_np, exp.mains_norm_params))
+
+    # number of batches for progress
+    n_iter = n_batches(len(data_normalized), exp.batch_size)
+
+    # generate predictions
+    # batches are strided views over the padded mains if the exp's ds_class allows it, else the ds_class is used
+    with torch.inference_mode():
+        for i, inputs in enumerate(iter_batches(exp, data_normalized)):
+            inputs = inputs.to(device)
+            yield model(inputs).cpu().numpy().flatten()
+            progress.update(i + 1, n_iter)
 
 
 @app.task(name="pred", bind=True)
@@ -30,97 +68,147 @@ def pred(self, predict_params_json: str) -> str:
     predict_params: PredictParams = PredictParams.model_validate_json(
         predict_params_json
     )
-    if self:
-        self.update_state(
-            state=TaskState.STARTED,
-            meta=PredProgressMsg(percentage=0).model_dump_json(),
-        )
+    progress = ProgressReporter(self, PredProgressMsg)
+    progress.start()
 
     exp: exps.ModelExp = exps.get_model_exp_by_name(predict_params.model_exp_name)
-    device: torch.device = get_device()
-    model: nn.Module = get_model_for_exp(predict_params.model_exp_name, device)
+    preds = np.concatenate(list(iter_pred_batches(predict_params, exp, progress)))
+    preds_flat_denorm: np.ndarray = np.array(
+        enilm.norm.denormalize(preds, exp.app_norm_params)
+    )
 
-    # set the model to evaluation mode i.e. disabling dropout and using population statistics for batch normalization
-    model.eval()
+    progress.finish()
 
-    # convert data to expected format
-    data_np: np.ndarray = np.array(list(predict_params.data.values()), dtype=np.float32)
+    return to_predict_response(predict_params, exp, preds_flat_denorm).model_dump_json()
 
-    # normalize data
-    data_normalized = np.array(enilm.norm.normalize(data_np, exp.mains_norm_params))
 
-    # number of iter over data_loader for progress
-    n_iter = len(data_normalized) / exp.batch_size
-    n_iter = np.ceil(
-        n_iter
-    )  # to avoid cases where n_iter becomes zero due to small data size, since it used as the divisor below
-
-    # put data into loader
-    data_loader = DataLoader(
-        get_exp_ds_class(exp)(
-            mains=data_normalized,
-            sequence_length=exp.sequence_length,
-            reshape=True,
-            pad=True,
-        ),
-        batch_size=exp.batch_size,
-        shuffle=False,
-    )
+@app.task(name="pred_stream", bind=True)
+def pred_stream(self, predict_params_json: str) -> str:
+    """
+    Same predictions as the `pred` task, pushed in chunks as soon as their batches are done
 
-    # generate predictions
-    preds = []
-    for inputs in data_loader:
-        inputs = inputs.to(device)
-        preds.append(model(inputs).cpu().detach().numpy().flatten())
-        if self:
-            progress_percentage = int(len(preds) / n_iter * 100)
-            if progress_percentage > 100:
-                progress_percentage = 100
-            self.update_state(
-                state=TaskState.RUNNING,
-                meta=PredProgressMsg(percentage=progress_percentage).model_dump_json(),
-            )
-    preds = np.concatenate(preds)
-    preds_flat_denorm: np.ndarray = np.array(
-        enilm.norm.denormalize(preds, exp.app_norm_params)
+    The chunks are consumed by the api (see backend.pred_stream), the task result is the end item.
+    """
+    predict_params: PredictParams = PredictParams.model_validate_json(
+        predict_params_json
     )
-
-    if self:
-        self.update_state(
-            state=TaskState.FINISHED,
-            meta=PredProgressMsg(percentage=100).model_dump_json(),
+    progress = ProgressReporter(self, PredProgressMsg)
+    progress.start()
+    task_id = self.request.id
+
+    try:
+        exp: exps.ModelExp = exps.get_model_exp_by_name(predict_params.model_exp_name)
+        n = len(series_values(predict_params.data))
+        timestamps = (
+            list(predict_params.data.keys())
+            if not isinstance(predict_params.data, RegularSeries)
+            else None
         )
 
-    # add timestamps
-    pred_ts: RawDataDict = {
-        ts: pred for ts, pred in zip(predict_params.data.keys(), preds_flat_denorm)
-    }
+        preds_denorm = []  # kept for the errors
+        pending = []
+        offset = 0
 
-    # compute errors if gt is provided
-    if predict_params.gt is not None:
-        errors = []
-        gt_np: np.ndarray = np.array(list(predict_params.gt.values()), dtype=np.float32)
-
-        # MAE
-        errors.append(
-            PredictionError(
-                name="MAE",
-                value=metrics.mae(gt_np, preds_flat_denorm),
-                unit="W",
+        def push_pending():
+            nonlocal pending, offset
+            chunk = np.array(
+                enilm.norm.denormalize(np.concatenate(pending), exp.app_norm_params)
             )
-        )
-
-        # F1
-        errors.append(
-            PredictionError(
-                name="F1",
-                value=metrics.f1_score(
-                    gt_np, preds_flat_denorm, exp.on_power_threshold
+            pending = []
+            preds_denorm.append(chunk)
+            pred_ts: RegularSeries | RawDataDict
+            if isinstance(predict_params.data, RegularSeries):
+                pred_ts = predict_params.data.chunk(offset, chunk)
+            else:
+                assert timestamps is not None
+                pred_ts = dict(zip(timestamps[offset : offset + len(chunk)], chunk))
+            offset += len(chunk)
+            percentage = min(int(offset / n * 100), 100) if n > 0 else 100
+            push_stream_item(
+                task_id,
+                PredStreamChunk(
+                    msg=PredProgressMsg(percentage=percentage), pred=pred_ts
                 ),
-                unit="",
+            )
+
+        for batch_preds in iter_pred_batches(predict_params, exp, progress):
+            pending.append(batch_preds)
+            if sum(len(p) for p in pending) >= pred_stream_chunk_size:
+                push_pending()
+        if len(pending) > 0:
+            push_pending()
+
+        end = PredStreamEnd(
+            errors=(
+                pred_errors(predict_params, exp, np.concatenate(preds_denorm))
+                if len(preds_denorm) > 0
+                else None
             )
         )
+    except Exception as e:
+        push_stream_item(task_id, PredStreamError(msg=str(e)))
+        raise
+
+    push_stream_item(task_id, end)
+    progress.finish()
+    return end.model_dump_json()
+
+
+def to_predict_response(
+    predict_params: PredictParams,
+    exp: exps.ModelExp,
+    preds_flat_denorm: np.ndarray,
+) -> PredictResponse:
+    # add timestamps (in the same form as the input)
+    pred_ts: RegularSeries | RawDataDict
+    if isinstance(predict_params.data, RegularSeries):
+        pred_ts = predict_params.data.with_values(preds_flat_denorm)
+    else:
+        pred_ts = {
+            ts: pred for ts, pred in zip(predict_params.data.keys(), preds_flat_denorm)
+        }
+
+    return PredictResponse(
+        pred=pred_ts, errors=pred_errors(predict_params, exp, preds_flat_denorm)
+    )
 
-        return PredictResponse(pred=pred_ts, errors=errors).model_dump_json()
 
-    return PredictResponse(pred=pred_ts).model_dump_json()
+def pred_errors(
+    predict_params: PredictParams,
+    exp: exps.ModelExp,
+    preds_flat_denorm: np.ndarray,
+) -> List[PredictionError] | None:
+    # compute errors if gt is provided
+    if predict_params.gt is None:
+        return None
+
+    gt_np: np.ndarray = series_values(predict_params.gt)
+    sums = metrics.ErrSums.of(gt_np, preds_flat_denorm, exp.on_power_threshold)
+    return [
+        PredictionError(name=err_type.value, value=value, unit=err_units[err_type])
+        for err_type, value in sums.metrics(metrics.pred_err_types).items()
+    ]
+
+
+@app.task(name="pred_chunk")
+def pred_chunk(params_json: str) -> str:
+    """
+    Model outputs (normalized) for one chunk of a longer series (see backend.pred.chunked_pred)
+
+    Only for exps with strided windows. The batches are the same as in the `pred` task if
+    the chunk starts at a multiple of the batch size.
+    """
+    p = PredChunkTaskParams.model_validate_json(params_json)
+    exp: exps.ModelExp = exps.get_model_exp_by_name(p.model_exp_name)
+    device: torch.device = get_device()
+    model: InferenceModel = get_inference_model(p.model_exp_name, device)
+
+    data_normalized = np.array(enilm.norm.normalize(p.mains, exp.mains_norm_params))
+    windows = padded_windows(data_normalized, exp.sequence_length, p.pad)
+
+    preds = []
+    with torch.inference_mode():
+        for batch_start in range(0, windows.size(0), exp.batch_size):
+            inputs = windows[batch_start : batch_start + exp.batch_size].contiguous()
+            preds.append(model(inputs.to(device)).cpu().numpy().flatten())
+    return PredChunkTaskResult(pred=np.concatenate(preds)).model_dump_json()
@@ -0,0 +1,31 @@
+from celery.signals import worker_ready
+
+from .celery import app
+from ..redis import redis_client
+from ..model import get_weights_hash
+from ..quant import quantized_exps, has_quant_report, store_quant_report
+
+# the report of a failed task is enqueued again after this many seconds
+quant_report_pending_ttl = 3600
+
+
+@app.task(name="quant_report")
+def quant_report(exp_name: str) -> str:
+    """Accuracy report of the int8 model of the exp (see backend.quant), built if not stored yet"""
+    return store_quant_report(exp_name).model_dump_json()
+
+
+def enqueue_quant_report(exp_name: str):
+    """One quant_report task per exp and weights, however many requests find no report"""
+    if has_quant_report(exp_name):
+        return
+    pending_key = f"quant_report_pending:{exp_name}:{get_weights_hash(exp_name)}"
+    if redis_client.set(pending_key, 1, nx=True, ex=quant_report_pending_ttl):
+        quant_report.delay(exp_name)
+
+
+@worker_ready.connect
+def on_worker_ready(**kwargs):
+    # once per worker (not per process): accuracy reports of the quantized models in the background
+    for exp_name in quantized_exps:
+        enqueue_quant_report(exp_name)
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("enilm")
+
+from backend import err_index
+from backend.pred_store import store_full_pred
+from backend.types.err import ErrType
+
+
+def test_err_index_uses_the_threshold_of_the_data_exp(tmp_path, monkeypatch):
+    index = pd.date_range("2023-01-01", periods=8, freq="min", tz="Europe/Berlin")
+    gt = np.array([0, 5, 10, 20, 0, 5, 10, 20], dtype=np.float32)
+    pr = np.array([0, 10, 5, 20, 0, 10, 5, 20], dtype=np.float32)
+    data = {"mains": pd.Series(gt, index=index), "fridge": pd.Series(gt, index=index)}
+    pred = store_full_pred(tmp_path / "pred", pr, index)
+
+    thresholds = {"data_a": 2.0, "data_b": 8.0, "model": 100.0}
+    monkeypatch.setattr(
+        err_index.exps,
+        "get_exp_by_name",
+        lambda name: SimpleNamespace(on_power_threshold=thresholds[name]),
+    )
+    monkeypatch.setattr(err_index, "get_weights_hash", lambda name: "weights")
+    monkeypatch.setattr(err_index, "get_overlapping_data", lambda name: data)
+    monkeypatch.setattr(
+        err_index.apps,
+        "find_matching_app_name_in_data_keys",
+        lambda exp_name, app_name, keys, *args: app_name,
+    )
+    monkeypatch.setattr(err_index, "full_pred", lambda **kwargs: pred)
+    err_index._err_indexes.clear()
+
+    index_a = err_index.get_err_index("data_a", "fridge", "model")
+    index_b = err_index.get_err_index("data_b", "fridge", "model")
+
+    # not reused across thresholds, neither in memory nor on disk
+    assert index_a is not index_b
+    assert index_a.path != index_b.path
+    # on at > 2 W: 6 tp, on at > 8 W: 2 tp (20 W) + 2 fn (10 W) + 2 fp (10 W predicted)
+    f1_a = index_a.sums(0, len(index)).metric(ErrType.F1)
+    f1_b = index_b.sums(0, len(index)).metric(ErrType.F1)
+    assert f1_a == pytest.approx(1.0)
+    assert f1_b == pytest.approx(0.5)
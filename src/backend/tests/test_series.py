@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from backend.types.series import RegularSeries
+
+
+def test_regular_series_json_round_trip_keeps_tz_over_dst():
+    # 2023-03-26: Europe/Berlin skips 02:00
+    index = pd.date_range("2023-03-26 00:00", periods=5, freq="h", tz="Europe/Berlin")
+    ser = pd.Series(np.arange(5, dtype=np.float32), index=index)
+    regular = RegularSeries.from_pd(ser)
+    assert regular is not None
+
+    parsed = RegularSeries.model_validate_json(regular.model_dump_json())
+
+    assert str(parsed.index().tz) == "Europe/Berlin"
+    assert parsed.index().equals(index)
+    assert list(parsed.index().hour) == [0, 1, 3, 4, 5]
+    np.testing.assert_array_equal(parsed.values, ser.to_numpy())
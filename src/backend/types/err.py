@@ -1,5 +1,35 @@
 from enum import Enum
+from typing import Dict
+
+from pydantic import BaseModel
+
 
 class ErrType(Enum):
     MAE = "MAE"
-    F1 = "F1"
\ No newline at end of file
+    F1 = "F1"
+    RMSE = "RMSE"
+    SAE = "SAE"  # signal aggregate error: |sum(pr) - sum(gt)| / sum(gt)
+    NDE = "NDE"  # normalized disaggregation error: sum((gt - pr)^2) / sum(gt^2)
+    EA = "EA"  # energy accuracy: 1 - sum(|gt - pr|) / (2 * sum(gt))
+    PRECISION = "Precision"
+    RECALL = "Recall"
+
+
+err_units: Dict[ErrType, str] = {
+    ErrType.MAE: "W",
+    ErrType.F1: "",
+    ErrType.RMSE: "W",
+    ErrType.SAE: "",
+    ErrType.NDE: "",
+    ErrType.EA: "",
+    ErrType.PRECISION: "",
+    ErrType.RECALL: "",
+}
+
+
+class SplitErrors(BaseModel):
+    """Errors of the train and test part of a series (split at the train percentage) and of both"""
+
+    train: Dict[ErrType, float]
+    test: Dict[ErrType, float]
+    total: Dict[ErrType, float]
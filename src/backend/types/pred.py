@@ -3,15 +3,16 @@ from typing import List
 from pydantic import BaseModel, ConfigDict
 import enilm.yaml.data
 
-from . import RawDataDict
+from .series import SeriesData
 
 
 class PredictParams(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
-    data: RawDataDict
+    data: SeriesData  # dict or compact form, the prediction is returned in the same form
     app_name: enilm.yaml.data.Label
     model_exp_name: str
-    gt: RawDataDict | None = None  # ground truth data to compute errors
+    gt: SeriesData | None = None  # ground truth data to compute errors
+    quantized: bool | None = None  # int8 model on cpu, None -> exp default (see backend.quant)
 
 
 class PredictionError(BaseModel):
@@ -21,5 +22,5 @@ class PredictionError(BaseModel):
 
 
 class PredictResponse(BaseModel):
-    pred: RawDataDict
+    pred: SeriesData
     errors: List[PredictionError] | None = None
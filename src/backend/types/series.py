@@ -0,0 +1,125 @@
+import base64
+from typing import Annotated
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel, Field, PlainValidator, PlainSerializer, WithJsonSchema
+from pydantic_core.core_schema import SerializationInfo
+
+from . import PDTimestamp, RawDataDict
+
+
+def to_float32_array(x) -> np.ndarray:
+    # base64 string (json) or raw bytes (msgpack) of little-endian float32 values
+    if isinstance(x, str):
+        return np.frombuffer(base64.b64decode(x), dtype="<f4")
+    if isinstance(x, (bytes, bytearray, memoryview)):
+        return np.frombuffer(x, dtype="<f4")
+    return np.asarray(x, dtype=np.float32)
+
+
+def serialize_float32_array(x: np.ndarray, info: SerializationInfo):
+    if info.mode == "json":
+        return base64.b64encode(np.asarray(x, dtype="<f4").tobytes()).decode()
+    return x
+
+
+# serialized to base64 of little-endian float32 in json (~5.3 chars per value)
+NPArray_F32 = Annotated[
+    np.ndarray,
+    PlainValidator(to_float32_array),
+    PlainSerializer(serialize_float32_array),
+    WithJsonSchema(
+        {
+            "anyOf": [
+                {"type": "string", "contentEncoding": "base64"},
+                {"type": "array", "items": {"type": "number"}},
+            ]
+        }
+    ),
+]
+
+
+class RegularSeries(BaseModel):
+    """Compact form of a series with a regular index: `values[i]` is at `start + i * freq`"""
+
+    start: PDTimestamp
+    freq: str  # pandas offset alias, e.g. "min" or "6s"
+    tz: str | None = None
+    values: NPArray_F32
+
+    def index(self) -> pd.DatetimeIndex:
+        start = self.start
+        if self.tz is not None:
+            # a parsed start (e.g. from json) only has its utc offset
+            if start.tzinfo is None:
+                start = start.tz_localize(self.tz)
+            else:
+                start = start.tz_convert(self.tz)
+        return pd.date_range(start, periods=len(self.values), freq=self.freq)
+
+    def with_values(self, values: np.ndarray) -> "RegularSeries":
+        """Same index with other values (e.g. predictions for the mains)"""
+        return RegularSeries(
+            start=self.start, freq=self.freq, tz=self.tz, values=values
+        )
+
+    def chunk(self, offset: int, values: np.ndarray) -> "RegularSeries":
+        """Series starting `offset` samples after this one (e.g. a part of the predictions)"""
+        return RegularSeries(
+            start=self.start + offset * pd.tseries.frequencies.to_offset(self.freq),
+            freq=self.freq,
+            tz=self.tz,
+            values=values,
+        )
+
+    @classmethod
+    def from_pd(cls, ser: pd.Series) -> "RegularSeries | None":
+        """None if the index of the series is not regular"""
+        index = ser.index
+        assert isinstance(index, pd.DatetimeIndex)
+        freq = regular_freq(index)
+        if freq is None:
+            return None
+        return cls(
+            start=index[0],
+            freq=freq,
+            tz=str(index.tz) if index.tz is not None else None,
+            values=ser.to_numpy(dtype=np.float32),
+        )
+
+
+def regular_freq(index: pd.DatetimeIndex) -> str | None:
+    """Frequency as pandas offset alias if the index is regular, else None"""
+    if len(index) < 2:
+        return None
+    steps = np.diff(index.asi8)  # in the unit of the index
+    if steps[0] <= 0 or not np.all(steps == steps[0]):
+        return None
+    return pd.tseries.frequencies.to_offset(
+        pd.Timedelta(int(steps[0]), unit=index.unit)
+    ).freqstr
+
+
+# either compact or dict form, the compact form is tried first
+SeriesData = Annotated[RegularSeries | RawDataDict, Field(union_mode="left_to_right")]
+
+
+def to_series_data(ser: pd.Series) -> RegularSeries | RawDataDict:
+    """Compact form if the index is regular, else dict form"""
+    regular = RegularSeries.from_pd(ser)
+    if regular is not None:
+        return regular
+    return ser.to_dict()
+
+
+def series_values(data: RegularSeries | RawDataDict) -> np.ndarray:
+    if isinstance(data, RegularSeries):
+        return np.asarray(data.values, dtype=np.float32)
+    return np.array(list(data.values()), dtype=np.float32)
+
+
+def series_index(data: RegularSeries | RawDataDict) -> pd.DatetimeIndex:
+    if isinstance(data, RegularSeries):
+        return data.index()
+    return pd.DatetimeIndex(list(data.keys()))
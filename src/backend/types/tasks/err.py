@@ -1,24 +1,28 @@
-from typing import List
+from pathlib import Path
+from typing import Dict, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 import enilm.etypes
 
 from . import TaskState
-from ..pred import PredictResponse
-from ..err import ErrType
+from ..series import NPArray_F32
+from ..err import ErrType, SplitErrors
 
 
 class ComputeErrTaskParams(BaseModel):
     exp_name: str
-    app_name: enilm.etypes.AppName
+    app_name: enilm.etypes.AppName  # key in the data
     err_type: ErrType
     seq_len: int
     on_power_threshold: float
-    full_pred: PredictResponse
+    full_pred_path: Path  # see backend.pred_store
 
 
 class ComputeErrTaskResult(BaseModel):
-    errors: List[float]
+    errors: NPArray_F32  # one per window
+    # F1 only: precision and recall of each window
+    precision: NPArray_F32 | None = None
+    recall: NPArray_F32 | None = None
 
 
 class ComputeErrProgressMsg(BaseModel):
@@ -28,3 +32,33 @@ class ComputeErrProgressMsg(BaseModel):
 class ComputerErrProgressResponse(BaseModel):
     state: TaskState
     msg: ComputeErrProgressMsg
+
+
+class CompareModel(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    model_exp_name: str
+    full_pred_path: Path  # see backend.pred_store
+    on_power_threshold: float
+    selected_train_percent: float
+
+
+class CompareTaskParams(BaseModel):
+    data_exp_name: str
+    app_name: enilm.etypes.AppName  # key in the data
+    models: List[CompareModel]
+    err_types: List[ErrType]
+    window: int | None = None  # samples
+
+
+class ModelErrors(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    model_exp_name: str
+    errors: SplitErrors
+    # one per window starting at each sample, aligned between the models
+    window_errors: Dict[ErrType, NPArray_F32] | None = None
+
+
+class CompareTaskResult(BaseModel):
+    n_samples: int
+    window: int | None = None
+    models: List[ModelErrors]  # in the order of the params
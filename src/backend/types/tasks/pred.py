@@ -1,6 +1,10 @@
+from typing import Annotated, List, Literal, Tuple
+
 from . import TaskState
+from ..series import NPArray_F32, SeriesData
+from ..pred import PredictionError
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class PredProgressMsg(BaseModel):
@@ -10,3 +14,40 @@ class PredProgressMsg(BaseModel):
 class PredProgressResponse(BaseModel):
     state: TaskState
     msg: PredProgressMsg
+
+
+class PredChunkTaskParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    model_exp_name: str
+    # mains of the chunk including the context of its first and last windows
+    mains: NPArray_F32
+    # zero padding (left, right), see backend.windows.context_slice
+    pad: Tuple[int, int]
+
+
+class PredChunkTaskResult(BaseModel):
+    pred: NPArray_F32  # normalized model outputs, one per sample of the chunk
+
+
+# items of a streamed prediction (see backend.pred_stream), one json object per line in ndjson
+
+
+class PredStreamChunk(BaseModel):
+    type: Literal["chunk"] = "chunk"
+    msg: PredProgressMsg  # progress after this chunk
+    pred: SeriesData  # predictions for the next samples, same form as the input
+
+
+class PredStreamEnd(BaseModel):
+    type: Literal["end"] = "end"
+    errors: List[PredictionError] | None = None
+
+
+class PredStreamError(BaseModel):
+    type: Literal["error"] = "error"
+    msg: str
+
+
+PredStreamItem = Annotated[
+    PredStreamChunk | PredStreamEnd | PredStreamError, Field(discriminator="type")
+]
@@ -0,0 +1,42 @@
+from typing import List, Literal
+
+from pydantic import BaseModel, ConfigDict
+import enilm.etypes
+
+from . import PDTimestamp
+from .series import SeriesData
+
+
+class MainsEdit(BaseModel):
+    start: PDTimestamp
+    end: PDTimestamp  # inclusive
+    values: List[
+        float
+    ]  # one value per sample in [start, end] or a single value for all samples
+    mode: Literal["replace", "add"] = "replace"  # replace the mains or add to them
+
+
+class WhatIfParams(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+    data_exp_name: str
+    model_exp_name: str
+    app_name: enilm.etypes.AppName
+    edits: List[MainsEdit]
+    # range of the returned predictions, defaults to the range affected by the edits
+    view_start: PDTimestamp | None = None
+    view_end: PDTimestamp | None = None
+
+
+class WhatIfError(BaseModel):
+    name: str
+    base: float  # with the original mains
+    new: float  # with the edited mains
+    unit: str
+
+
+class WhatIfResponse(BaseModel):
+    pred: SeriesData  # cached predictions with the re-predicted samples spliced in
+    base_pred: SeriesData  # cached predictions for the same range
+    n_repredicted: int  # number of re-predicted samples
+    errors: List[WhatIfError]  # over the whole series
+    view_errors: List[WhatIfError]  # over the returned range
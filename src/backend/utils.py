@@ -1,7 +1,16 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
 import torch
 
 from .consts import selected_gpu
 
+V = TypeVar("V")
+
 
 def get_device() -> torch.device:
     # check if CUDA is available
@@ -11,3 +20,41 @@ def get_device() -> torch.device:
     elif torch.backends.mps.is_available():
         device = torch.device("mps")
     return device
+
+
+def tmp_path_for(path: Path) -> Path:
+    """Temp. file next to path (same file system for `os.replace`), not matched by its suffix"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".part")
+    os.close(fd)
+    return Path(tmp)
+
+
+class LRUCache(Generic[V]):
+    """Process-level LRU cache of at most `max_size` entries (as backend.model.ModelCache)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[Hashable, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> V | None:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: V):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
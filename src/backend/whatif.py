@@ -0,0 +1,246 @@
+# what-if: re-predict only the samples whose windows overlap edited mains
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import torch
+
+import enilm.norm
+
+from . import tz
+from . import apps
+from . import exps
+from .data import get_overlapping_data
+from .pred import full_pred
+from .utils import get_device
+from .export import get_inference_model
+from .metrics import ErrSums, pred_err_types
+from .err_index import get_err_index
+from .windows import padded_windows, context_slice, strided_ds_classes
+from .types.err import err_units
+from .types.series import to_series_data
+from .types.whatif import MainsEdit, WhatIfParams, WhatIfResponse, WhatIfError
+
+
+@dataclass
+class IndexedEdit:
+    start: int
+    stop: int  # exclusive
+    values: np.ndarray
+    add: bool
+
+
+def index_edits(
+    edits: List[MainsEdit],
+    index: pd.DatetimeIndex,
+    exp_name: str,
+) -> List[IndexedEdit]:
+    indexed = []
+    for edit in edits:
+        start = int(
+            index.searchsorted(
+                tz.convert_pdtimestamp_for_exp_data(edit.start, exp_name), "left"
+            )
+        )
+        stop = int(
+            index.searchsorted(
+                tz.convert_pdtimestamp_for_exp_data(edit.end, exp_name), "right"
+            )
+        )
+        if start >= stop:
+            continue
+        values = np.asarray(edit.values, dtype=np.float32)
+        if values.size == 1:
+            values = np.full(stop - start, values[0], dtype=np.float32)
+        if values.size != stop - start:
+            raise ValueError(
+                f"Edit from {edit.start} to {edit.end} covers {stop - start} samples but has {values.size} values"
+            )
+        indexed.append(IndexedEdit(start, stop, values, edit.mode == "add"))
+    return indexed
+
+
+def apply_edits(mains: np.ndarray, offset: int, edits: List[IndexedEdit]) -> np.ndarray:
+    """Apply the edits (in order) to a slice of the mains starting at `offset`"""
+    mains = mains.copy()
+    for edit in edits:
+        start = max(edit.start, offset)
+        stop = min(edit.stop, offset + len(mains))
+        if start >= stop:
+            continue
+        values = edit.values[start - edit.start : stop - edit.start]
+        if edit.add:
+            mains[start - offset : stop - offset] += values
+        else:
+            mains[start - offset : stop - offset] = values
+    return mains
+
+
+def affected_ranges(
+    edits: List[IndexedEdit], n: int, sequence_length: int
+) -> List[Tuple[int, int]]:
+    """Merged ranges of predictions whose windows contain at least one edited sample"""
+    half_seq_len = sequence_length // 2
+    ranges = sorted(
+        (max(0, edit.start - half_seq_len), min(n, edit.stop + half_seq_len))
+        for edit in edits
+    )
+    merged: List[Tuple[int, int]] = []
+    for start, stop in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def repredict(
+    exp: exps.ModelExp,
+    mains: pd.Series,
+    edits: List[IndexedEdit],
+    start: int,
+    stop: int,
+) -> np.ndarray:
+    """Predictions for the samples [start, stop) of the edited mains"""
+    device = get_device()
+    model = get_inference_model(exp.exp_name, device)
+
+    slice_start, slice_stop, pad = context_slice(
+        start, stop, len(mains), exp.sequence_length
+    )
+    mains_slice = apply_edits(
+        mains.iloc[slice_start:slice_stop].to_numpy(dtype=np.float32),
+        slice_start,
+        edits,
+    )
+    mains_normalized = np.array(
+        enilm.norm.normalize(mains_slice, exp.mains_norm_params), dtype=np.float32
+    )
+    windows = padded_windows(mains_normalized, exp.sequence_length, pad)
+
+    preds = []
+    with torch.inference_mode():
+        for batch_start in range(0, windows.size(0), exp.batch_size):
+            inputs = (
+                windows[batch_start : batch_start + exp.batch_size]
+                .contiguous()
+                .to(device)
+            )
+            preds.append(model(inputs).cpu().numpy().flatten())
+    return np.array(
+        enilm.norm.denormalize(np.concatenate(preds), exp.app_norm_params),
+        dtype=np.float32,
+    )
+
+
+def to_errors(base: ErrSums, new: ErrSums) -> List[WhatIfError]:
+    # same errors as returned with each prediction
+    base_errors = base.metrics(pred_err_types)
+    new_errors = new.metrics(pred_err_types)
+    return [
+        WhatIfError(
+            name=err_type.value,
+            base=base_errors[err_type],
+            new=new_errors[err_type],
+            unit=err_units[err_type],
+        )
+        for err_type in pred_err_types
+    ]
+
+
+def whatif(params: WhatIfParams) -> WhatIfResponse:
+    model_exp: exps.ModelExp = exps.get_model_exp_by_name(params.model_exp_name)
+    if model_exp.ds_class not in strided_ds_classes:
+        raise ValueError(
+            f"What-if is not supported for the ds_class {model_exp.ds_class}"
+        )
+
+    data = get_overlapping_data(params.data_exp_name)
+    matched_app_name = apps.find_matching_app_name_in_data_keys(
+        params.data_exp_name,
+        params.app_name,
+        data.keys(),
+    )
+    mains: pd.Series = data["mains"]
+    gt: pd.Series = data[matched_app_name]
+    index = mains.index
+    assert isinstance(index, pd.DatetimeIndex)
+    n = len(mains)
+
+    base = full_pred(
+        data_exp_name=params.data_exp_name,
+        app_name=matched_app_name,
+        model_exp_name=params.model_exp_name,
+    )
+    if len(base.values) != n:
+        raise ValueError("Stored prediction does not match the data")
+
+    edits = index_edits(params.edits, index, params.data_exp_name)
+    ranges = affected_ranges(edits, n, model_exp.sequence_length)
+
+    # range of the returned predictions
+    if params.view_start is not None and params.view_end is not None:
+        view_start = int(
+            index.searchsorted(
+                tz.convert_pdtimestamp_for_exp_data(
+                    params.view_start, params.data_exp_name
+                ),
+                "left",
+            )
+        )
+        view_stop = int(
+            index.searchsorted(
+                tz.convert_pdtimestamp_for_exp_data(
+                    params.view_end, params.data_exp_name
+                ),
+                "right",
+            )
+        )
+    elif len(ranges) > 0:
+        view_start, view_stop = ranges[0][0], ranges[-1][1]
+    else:
+        view_start, view_stop = 0, 0
+
+    # error sums of the stored prediction from its error index, no pass over the samples
+    on_power_threshold = model_exp.on_power_threshold
+    err_index = get_err_index(
+        params.data_exp_name,
+        matched_app_name,
+        params.model_exp_name,
+        on_power_threshold=on_power_threshold,
+    )
+    base_sums = err_index.sums(0, n)
+
+    # re-predict the affected ranges, splice them into the view and update the error sums
+    view_base = np.array(base.values[view_start:view_stop], dtype=np.float32)
+    view_new = view_base.copy()
+    view_gt = gt.iloc[view_start:view_stop].to_numpy(dtype=np.float32)
+    new_sums = base_sums
+    for start, stop in ranges:
+        preds = repredict(model_exp, mains, edits, start, stop)
+        gt_range = gt.iloc[start:stop].to_numpy(dtype=np.float32)
+        new_sums = (
+            new_sums
+            - err_index.sums(start, stop)
+            + ErrSums.of(gt_range, preds, on_power_threshold)
+        )
+
+        splice_start, splice_stop = max(start, view_start), min(stop, view_stop)
+        if splice_start < splice_stop:
+            view_new[splice_start - view_start : splice_stop - view_start] = preds[
+                splice_start - start : splice_stop - start
+            ]
+
+    view_index = index[view_start:view_stop]
+    return WhatIfResponse(
+        pred=to_series_data(pd.Series(view_new, index=view_index)),
+        base_pred=to_series_data(pd.Series(view_base, index=view_index)),
+        n_repredicted=sum(stop - start for start, stop in ranges),
+        errors=to_errors(base_sums, new_sums),
+        view_errors=to_errors(
+            err_index.sums(view_start, view_stop),
+            ErrSums.of(view_gt, view_new, on_power_threshold),
+        ),
+    )
@@ -0,0 +1,106 @@
+import importlib
+from typing import Iterator, Tuple
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import DataLoader
+
+from .types.exp import ModelExp
+
+# dataset classes whose samples are exactly the zero padded sliding windows of the mains
+# (see enilm.models.torch.utils.get_padded_sequence), these can be replaced by a strided view
+strided_ds_classes = {
+    "enilm.models.torch.seq.S2PDatasetMains",
+}
+
+
+def get_exp_ds_class(exp: ModelExp):
+    ds_class_path = ".".join(exp.ds_class.split(".")[:-1])
+    ds_class_name = exp.ds_class.split(".")[-1]
+    module = importlib.import_module(ds_class_path)
+    clazz = getattr(module, ds_class_name)
+    return clazz
+
+
+def padded_windows(
+    mains: np.ndarray,
+    sequence_length: int,
+    pad: Tuple[int, int] | None = None,
+) -> torch.Tensor:
+    """
+    Sliding windows centered around each sample as a strided view of shape (n, 1, sequence_length)
+
+    The only copy is the zero padded mains (n + sequence_length - 1 values), the windows are not materialized.
+    For a slice of a longer series, `pad` is the number of zeros (left, right) that are
+    still needed, the remaining context has to be included in the slice.
+    """
+    assert sequence_length % 2 == 1
+    half_seq_len = sequence_length // 2
+    if pad is None:
+        pad = (half_seq_len, half_seq_len)
+    padded = F.pad(torch.from_numpy(mains), pad)
+    return padded.unfold(0, sequence_length, 1).unsqueeze(1)
+
+
+def context_slice(
+    start: int, stop: int, n: int, sequence_length: int
+) -> Tuple[int, int, Tuple[int, int]]:
+    """
+    Slice of the mains needed to predict the samples [start, stop) of a series of length n
+
+    Returns the slice start and stop and the zero padding (left, right) for `padded_windows`.
+    """
+    half_seq_len = sequence_length // 2
+    slice_start = max(0, start - half_seq_len)
+    slice_stop = min(n, stop + half_seq_len)
+    pad = (
+        half_seq_len - (start - slice_start),
+        half_seq_len - (slice_stop - stop),
+    )
+    return slice_start, slice_stop, pad
+
+
+def n_batches(n_samples: int, batch_size: int) -> int:
+    # at least one to avoid division by zero when used for the progress
+    return max(1, int(np.ceil(n_samples / batch_size)))
+
+
+def iter_strided_batches(
+    mains: np.ndarray,
+    sequence_length: int,
+    batch_size: int,
+) -> Iterator[torch.Tensor]:
+    windows = padded_windows(mains, sequence_length)
+    for batch_start in range(0, windows.size(0), batch_size):
+        yield windows[batch_start : batch_start + batch_size].contiguous()
+
+
+def iter_ds_class_batches(
+    ds_class: type,
+    mains: np.ndarray,
+    sequence_length: int,
+    batch_size: int,
+) -> Iterator[torch.Tensor]:
+    data_loader = DataLoader(
+        ds_class(
+            mains=mains,
+            sequence_length=sequence_length,
+            reshape=True,
+            pad=True,
+        ),
+        batch_size=batch_size,
+        shuffle=False,
+    )
+    for inputs in data_loader:
+        yield inputs
+
+
+def iter_batches(exp: ModelExp, mains: np.ndarray) -> Iterator[torch.Tensor]:
+    """Model input batches for the normalized mains, one prediction per sample"""
+    if exp.ds_class in strided_ds_classes:
+        return iter_strided_batches(mains, exp.sequence_length, exp.batch_size)
+    # custom dataset that cannot be expressed as windows
+    return iter_ds_class_batches(
+        get_exp_ds_class(exp), mains, exp.sequence_length, exp.batch_size
+    )
@@ -2,6 +2,8 @@ import constants from "@/utils/constants";
 import * as datetime from "@/utils/datetime";
 
 
+// backend.downsample.DownsampleMode
+export type DownsampleMode = "minmax" | "mean" | "lttb";
 
 // backend.api.data.DataStartDurationParams
 export interface DataStartDurationParams {
@@ -9,6 +11,8 @@ export interface DataStartDurationParams {
     app_name: string;
     start: datetime.SimpleDateTimeString;
     duration: string;
+    max_points?: number;
+    downsample?: DownsampleMode;
 }
 
 export async function getDataStartDuration(params: DataStartDurationParams): Promise<datetime.SimpleDateTimeStringStampedData> {
@@ -28,6 +32,8 @@ export interface DataStartEndParams {
     app_name: string;
     start: datetime.SimpleDateTimeString;
     end: datetime.SimpleDateTimeString;
+    max_points?: number;
+    downsample?: DownsampleMode;
 }
 
 export async function getDataStartEnd(params: DataStartEndParams): Promise<datetime.SimpleDateTimeStringStampedData> {
@@ -41,6 +47,79 @@ export async function getDataStartEnd(params: DataStartEndParams): Promise<datet
     return datetime.isoDataToSimple(await resp.json());
 }
 
+// backend.api.data.PredStartEndParams
+export interface PredStartEndParams {
+    data_exp_name: string;
+    app_name: string;
+    model_exp_name?: string;
+    start: datetime.SimpleDateTimeString;
+    end: datetime.SimpleDateTimeString;
+    max_points?: number;
+    downsample?: DownsampleMode;
+}
+
+export async function getPredStartEnd(params: PredStartEndParams): Promise<datetime.SimpleDateTimeStringStampedData> {
+    const resp = await fetch(`${constants.backendApiUrl}/data/pred_start_end`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify(params),
+    });
+    return datetime.isoDataToSimple(await resp.json());
+}
+
+// backend.api.data.RangeSeriesParams
+export interface RangeSeriesParams {
+    app_name?: string; // mains if not set
+    pred?: boolean;
+    model_exp_name?: string;
+}
+
+// backend.api.data.RangeParams
+export interface RangeParams {
+    exp_name: string;
+    series: RangeSeriesParams[];
+    start: datetime.SimpleDateTimeString;
+    end: datetime.SimpleDateTimeString;
+    max_points?: number;
+    downsample?: DownsampleMode;
+}
+
+// backend.api.data.RangeIndex
+export interface RangeIndex {
+    n: number;
+    start: string | null;
+    freq: string | null;
+    tz: string | null;
+    timestamps: number[] | null; // ms since epoch (utc), irregular only
+}
+
+// backend.api.data.RangeColumn (base64 of little-endian float32)
+export interface RangeColumn {
+    values: string;
+    min: string | null;
+    max: string | null;
+}
+
+// backend.api.data.RangeResponse
+export interface RangeResponse {
+    index: RangeIndex;
+    downsampled: boolean;
+    columns: RangeColumn[]; // in the order of the requested series
+}
+
+export async function getRange(params: RangeParams): Promise<RangeResponse> {
+    const resp = await fetch(`${constants.backendApiUrl}/data/range`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify(params),
+    });
+    return await resp.json();
+}
+
 export async function getDatasets(): Promise<string[]> {
     const resp = await fetch(`${constants.backendApiUrl}/data/datasets`);
     return await resp.json();
@@ -28,6 +28,9 @@ export interface ErrHistResponse {
     hist: number[];
     bin_edges: number[];
     unit: string;
+    // F1 only
+    precision_hist: number[] | null;
+    recall_hist: number[] | null;
 }
 
 export async function getErrHist(params: ErrHistParams): Promise<ErrHistResponse> {
@@ -50,6 +53,14 @@ export interface RndDateWithErrParams {
     err_min: number;
     err_max: number;
     duration_samples: number;
+    k?: number;
+}
+
+// backend.api.err.RndDateWindow
+export interface RndDateWindow {
+    start_date: datetime.SimpleDateTimeString;
+    end_date: datetime.SimpleDateTimeString;
+    err: number;
 }
 
 // backend.api.err.RndDateWithErrResponse
@@ -59,6 +70,7 @@ export interface RndDateWithErrResponse {
     start_date: datetime.SimpleDateTimeString;
     end_date: datetime.SimpleDateTimeString;
     duration_samples: number;
+    windows: RndDateWindow[];
 }
 
 export async function getRndDateWithErr(params: RndDateWithErrParams): Promise<RndDateWithErrResponse> {
@@ -72,6 +84,11 @@ export async function getRndDateWithErr(params: RndDateWithErrParams): Promise<R
     const respObj = await resp.json() as RndDateWithErrResponse;
     respObj.start_date = datetime.isoToSimple(respObj.start_date);
     respObj.end_date = datetime.isoToSimple(respObj.end_date);
+    respObj.windows = respObj.windows.map((window) => ({
+        ...window,
+        start_date: datetime.isoToSimple(window.start_date),
+        end_date: datetime.isoToSimple(window.end_date),
+    }));
     return respObj as RndDateWithErrResponse;
 }
 
@@ -102,3 +119,78 @@ export async function getTotalErr(params: TotalErrParams): Promise<TotalErrRespo
     const respObj = await resp.json();
     return respObj as TotalErrResponse;
 }
+
+// backend.api.err.CompareParams
+export interface CompareParams {
+    data_exp_name: string;
+    app_name: string;
+    model_exp_names: string[];
+    err_types?: string[]; // all if not provided
+    window?: number | null;
+}
+
+// backend.types.err.SplitErrors
+export interface SplitErrors {
+    train: { [key: string]: number }; // key is err type
+    test: { [key: string]: number };
+    total: { [key: string]: number };
+}
+
+// backend.types.tasks.err.ModelErrors
+export interface ModelErrors {
+    model_exp_name: string;
+    errors: SplitErrors;
+    // base64 of little-endian float32, one per window starting at each sample
+    window_errors: { [key: string]: string } | null;
+}
+
+// backend.types.tasks.err.CompareTaskResult
+export interface CompareResponse {
+    n_samples: number;
+    window: number | null;
+    models: ModelErrors[];
+}
+
+export async function compareModels(params: CompareParams): Promise<CompareResponse> {
+    const resp = await fetch(`${constants.backendApiUrl}/err/compare`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify(params),
+    });
+    const respObj = await resp.json();
+    return respObj as CompareResponse;
+}
+
+// backend.api.err.ErrCubeParams
+export interface ErrCubeParams {
+    data_exp_name: string;
+    app_name: string;
+    model_exp_name?: string | null;
+    err_type: string;
+}
+
+export type DayType = "weekday" | "weekend" | "holiday";
+
+// backend.api.err.ErrCubeResponse
+export interface ErrCubeResponse {
+    days: string[]; // YYYY-MM-DD
+    day_types: DayType[];
+    errors: (number | null)[][]; // day x hour of day, null without samples
+    n_samples: number[][];
+    day_type_errors: { [key in DayType]: (number | null)[] }; // hour-of-day profiles
+    unit: string;
+}
+
+export async function getErrCube(params: ErrCubeParams): Promise<ErrCubeResponse> {
+    const resp = await fetch(`${constants.backendApiUrl}/err/cube`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+        },
+        body: JSON.stringify(params),
+    });
+    const respObj = await resp.json();
+    return respObj as ErrCubeResponse;
+}
@@ -71,3 +71,71 @@ export async function getAsyncPredictionResults(task_id: CeleryTaskId): Promise<
     respObj.pred = datetime.isoDataToSimple(respObj.pred);
     return respObj as PredictResponse;
 }
+
+// backend.api.tasks.get_task_events: progress pushed by the server instead of polling
+export function streamAsyncPrediction(
+    task_id: CeleryTaskId,
+    onProgress: (progress: PredProgressResponse) => void,
+): Promise<PredictResponse> {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${constants.backendApiUrl}/tasks/events/${task_id}`);
+        source.addEventListener("progress", (event) => {
+            onProgress(JSON.parse((event as MessageEvent).data) as PredProgressResponse);
+        });
+        source.addEventListener("result", (event) => {
+            source.close();
+            const respObj = JSON.parse((event as MessageEvent).data);
+            respObj.pred = datetime.isoDataToSimple(respObj.pred);
+            resolve(respObj as PredictResponse);
+        });
+        // failed task (with data) or lost connection (without data)
+        source.addEventListener("error", (event) => {
+            source.close();
+            reject(new Error((event as MessageEvent).data ?? "Lost connection to the prediction events"));
+        });
+    });
+}
+
+// backend.types.tasks.pred.PredStreamChunk / PredStreamEnd / PredStreamError
+type PredStreamItem =
+    | { type: "chunk", msg: PredProgressMsg, pred: datetime.ISOTimeStampStampedData }
+    | { type: "end", errors: PredictionError[] | null }
+    | { type: "error", msg: string };
+
+// backend.api.predict.stream_predict: ndjson, predictions are passed to onChunk as soon as they are available
+export async function streamPrediction(
+    params: PredictParams,
+    onChunk: (pred: datetime.SimpleDateTimeStringStampedData, msg: PredProgressMsg) => void,
+): Promise<PredictionError[] | null> {
+    const resp = await fetch(`${constants.backendApiUrl}/predict/stream`, {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json",
+            "Accept": "application/x-ndjson",
+        },
+        body: JSON.stringify(params),
+    });
+    if (!resp.body) throw new Error("No prediction stream");
+
+    const reader = resp.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += value;
+        const lines = buffer.split("\n");
+        buffer = lines.pop() ?? "";
+        for (const line of lines) {
+            if (line.trim() === "") continue;
+            const item = JSON.parse(line) as PredStreamItem;
+            if (item.type === "chunk") {
+                onChunk(datetime.isoDataToSimple(item.pred), item.msg);
+            } else if (item.type === "end") {
+                return item.errors;
+            } else {
+                throw new Error(item.msg);
+            }
+        }
+    }
+    throw new Error("Prediction stream ended unexpectedly");
+}
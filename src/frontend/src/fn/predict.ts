@@ -8,7 +8,6 @@ import * as api from "@/api";
 import * as colors from "@/utils/colors";
 import * as nav from "@/utils/nav";
 import { updateModelInfo } from "./models";
-import { TaskState } from "@/types/tasks";
 
 export async function predict(state: State, canvas: Canvas, elms: Elms) {
     nav.disableNavElms()
@@ -78,22 +77,18 @@ export async function predict(state: State, canvas: Canvas, elms: Elms) {
     }
     // const predictionResponse = await api.predict.getPrediction(pred_params);
     const pred_async_resp: api.predict.AsyncResponse = await api.predict.getAsyncPrediction(pred_params);
-    while (true) {
-        await new Promise(r => setTimeout(r, 100));
-        const pred_status: api.predict.PredProgressResponse = await api.predict.getAsyncPredictionProgress(pred_async_resp.task_id);
-        elms.pbar.title.textContent = "Predicting...";
-        elms.pbar.bar.style.display = 'block';
-        elms.pbar.bar.value = pred_status.msg.percentage;
-
-        if (pred_status.state === TaskState.SUCCESS)
-            break;
-        if (pred_status.state === TaskState.FAILED)
-            break;
-    }
-    elms.pbar.bar.style.display = 'none';
-    elms.pbar.title.textContent = "";
-
-    const predictionResponse = await api.predict.getAsyncPredictionResults(pred_async_resp.task_id);
+    elms.pbar.title.textContent = "Predicting...";
+    elms.pbar.bar.style.display = 'block';
+    elms.pbar.bar.value = 0;
+    const predictionResponse = await api.predict.streamAsyncPrediction(
+        pred_async_resp.task_id,
+        (pred_status: api.predict.PredProgressResponse) => {
+            elms.pbar.bar.value = pred_status.msg.percentage;
+        },
+    ).finally(() => {
+        elms.pbar.bar.style.display = 'none';
+        elms.pbar.title.textContent = "";
+    });
     const predTrace = new Trace(1, `${elms.data.app.value} pred`, predictionResponse.pred, colors.getMatplotlibColor(newTraces.length));
 
     // prediction error info